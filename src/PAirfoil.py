@@ -1,10 +1,13 @@
 
+import sqlite3
+
 import numpy as np
 
 from PyQt4 import QtGui, QtCore
 
 import PGraphicsItemsCollection as gc
 import PGraphicsItem
+import PContourReader
 import PLogger as logger
 
 
@@ -42,47 +45,34 @@ class Airfoil(object):
         self.brushcolor.setNamedColor('#7c8696')
 
     def readContour(self, filename, comment='#'):
+        """Read the contour (Selig or Lednicer format) from a file
 
-        try:
-            with open(filename, mode='r') as f:
-                lines = f.readlines()
-        except IOError as error:
-            logger.log.error('Unable to open file %s. Error was: %s' %
-                             (filename, error))
-            return False
+        Contours are parsed and normalized to unit chord by
+        PContourReader and kept in its cache.
+        """
+        # file names from the file dialogs are QStrings
+        if not isinstance(filename, basestring):
+            filename = unicode(filename)
 
-        data = [line for line in lines if comment not in line]
+        try:
+            cache = PContourReader.defaultCache()
+        except (sqlite3.Error, OSError) as error:
+            logger.log.info('Contour cache not available: %s' % (error))
+            cache = None
 
-        # check for correct data
-        # specifically important for drag and drop
         try:
-            x = [float(l.split()[0]) for l in data]
-            y = [float(l.split()[1]) for l in data]
-        except (ValueError, IndexError) as error:
-            try:
-                unicode(error, "ascii")
-            except:
-                logger.log.error('Unable to parse file %s. Unknown error caught.' %
-                                 (filename))
-                return False
-            logger.log.error('Unable to parse file %s. Error was: %s' %
+            self.raw_coordinates = PContourReader.readContour(
+                filename, comment=comment, cache=cache)
+        except (IOError, OSError, sqlite3.Error) as error:
+            logger.log.error('Unable to open file %s. Error was: %s' %
                              (filename, error))
-            logger.log.info('Maybe not a valid airfoil file was used.')
             return False
-        except:
-            logger.log.error('Unable to parse file %s. Unknown error caught.' %
-                             (filename))
+        except ValueError as error:
+            logger.log.error(str(error))
+            logger.log.info('Maybe not a valid airfoil file was used.')
             return False
 
-        # store airfoil coordinates as list of tuples
-        self.raw_coordinates = np.array((x, y))
-
-        # normalize airfoil to unit chord
-        self.raw_coordinates[0] -= np.min(x)
-        divisor = np.max(self.raw_coordinates[0])
-        self.raw_coordinates[0] /= divisor
-        self.raw_coordinates[1] /= divisor
-
+        x, y = self.raw_coordinates
         self.offset = [np.min(y), np.max(y)]
         self.chord = np.max(x) - np.min(x)
 
@@ -160,46 +150,28 @@ class Airfoil(object):
         """
         self.contour_group = QtGui.QGraphicsItemGroup(parent=self.contour_item,
                                                       scene=self.scene)
-        self.markers = QtGui.QGraphicsItemGroup(parent=self.contour_item,
-                                                scene=self.scene)
 
     def addMarkers(self):
         """Create marker for polygon contour"""
 
-        for x, y in zip(*self.raw_coordinates):
-
-            # put airfoil contour points as graphicsitem
-            points = gc.GraphicsCollection()
-            points.pen.setColor(QtGui.QColor(60, 60, 80, 255))
-            points.brush.setColor(QtGui.QColor(217, 63, 122, 255))
-            points.pen.setCosmetic(True)  # no pen thickness change when zoomed
-
-            points.Circle(x, y, 0.003, marker=True)
-
-            marker = PGraphicsItem.GraphicsItem(points, self.scene)
-            self.markers.addToGroup(marker)
+        # all contour points are one graphics item
+        self.markers = PGraphicsItem.MarkerItem(
+            self.raw_coordinates,
+            QtGui.QColor(60, 60, 80, 255),
+            QtGui.QColor(217, 63, 122, 255),
+            parent=self.contour_item)
 
         self.contour_group.addToGroup(self.markers)
 
     def addMarkersSpline(self):
         """Create marker for polygon contour"""
 
-        self.markersSpline = QtGui.QGraphicsItemGroup(
-            parent=self.contour_item,
-            scene=self.scene)
-
-        for x, y in zip(*self.spline_data[0]):
-
-            # put airfoil contour points as graphicsitem
-            points = gc.GraphicsCollection()
-            points.pen.setColor(QtGui.QColor(60, 60, 80, 255))
-            points.brush.setColor(QtGui.QColor(180, 180, 50, 230))
-            points.pen.setCosmetic(True)  # no pen thickness change when zoomed
-
-            points.Circle(x, y, 0.003, marker=True)
-
-            marker = PGraphicsItem.GraphicsItem(points, self.scene)
-            self.markersSpline.addToGroup(marker)
+        # all contour points are one graphics item
+        self.markersSpline = PGraphicsItem.MarkerItem(
+            self.spline_data[0],
+            QtGui.QColor(60, 60, 80, 255),
+            QtGui.QColor(180, 180, 50, 230),
+            parent=self.contour_item)
 
         self.contour_group.addToGroup(self.markersSpline)
 
@@ -0,0 +1,517 @@
+"""
+Index of the airfoil library with geometric properties of each contour.
+
+Every contour file below the airfoil directory is parsed once in a pool
+of worker processes. Its properties are kept in an SQLite database
+together with the modification time and size of the file, so later
+updates only parse new and changed files. Queries on the properties are
+then answered from the database without touching the contour files.
+
+Properties (fractions of the chord):
+   - thickness, thickness_x
+     Largest distance of upper and lower side and its position
+   - camber, camber_x
+     Largest distance of the camber line from the chord and its position
+   - le_radius
+     Smallest radius of curvature at the leading edge
+   - te_thickness
+     Distance of the first and the last contour point
+
+Query syntax (see AirfoilIndex.query), values in percent of the chord:
+    thickness=9..10 camber>2 camber_x<=40 naca
+Words without comparison match parts of the file names.
+
+For the similarity search each contour is also described by a shape
+feature vector, the ordinates of its upper and lower side at cosine
+spaced stations. The vectors of the whole library are written to a
+matrix file next to the database, which is memory-mapped and searched
+with a KD-tree (see AirfoilIndex.nearest).
+
+Qt is not needed, so the module can also be used in scripts.
+"""
+
+import os
+import re
+import sys
+import sqlite3
+import multiprocessing
+
+import numpy as np
+import scipy.interpolate as si
+import scipy.spatial
+
+import PContourReader
+from PSettings import AIRFOILDATA, AIRFOILINDEX
+
+
+# properties of a contour, i.e. the columns of the index besides the file
+PROPERTIES = ['thickness', 'thickness_x', 'camber', 'camber_x',
+              'le_radius', 'te_thickness']
+
+# stations along the chord at which thickness and camber are evaluated
+STATIONS = 201
+
+# stations per side of the shape feature vectors
+FEATURESTATIONS = 32
+
+# changes of the table layout or of the features make the index rebuilt
+INDEXVERSION = 2
+
+# the leading edge radius is searched in this part of the chord
+LEREGION = 0.1
+
+# contours per task sent to a worker process
+CHUNKSIZE = 16
+
+# a query term is a property, a comparison and a value or a range a..b
+TERM = re.compile(r'^(\w+)(<=|>=|<|>|=)(%s)(?:\.\.(%s))?$' %
+                  (PContourReader.NUMBER, PContourReader.NUMBER))
+
+
+def contourGeometry(coordinates):
+    """Geometric properties of a normalized contour
+
+    Args:
+        coordinates (numpy array): Contour coordinates in Selig order with
+                                   unit chord, shape (2, n)
+
+    Returns:
+        dict: Value of each property in PROPERTIES
+    """
+    x, y = coordinates
+    stations = cosineStations(STATIONS)
+    upper, lower = sideOrdinates(coordinates, stations)
+
+    # the sides may be in either order, e.g. for inverted contours
+    thickness = np.abs(upper - lower)
+    camber = 0.5 * (upper + lower)
+    t = np.argmax(thickness)
+    c = np.argmax(np.abs(camber))
+
+    geometry = dict()
+    geometry['thickness'] = thickness[t]
+    geometry['thickness_x'] = stations[t]
+    geometry['camber'] = camber[c]
+    geometry['camber_x'] = stations[c]
+    geometry['le_radius'] = leRadius(x, y)
+    geometry['te_thickness'] = np.hypot(x[0] - x[-1], y[0] - y[-1])
+    return geometry
+
+
+def shapeFeatures(coordinates, stations=FEATURESTATIONS):
+    """Shape feature vector of a normalized contour
+
+    The Euclidean distance of two vectors compares the shapes, the
+    cosine spacing weights the leading edge region.
+
+    Args:
+        coordinates (numpy array): Contour coordinates in Selig order with
+                                   unit chord, shape (2, n)
+        stations (int, optional): Number of stations per side
+
+    Returns:
+        numpy array: Ordinates of the upper and then the lower side,
+                     shape (2 * stations, )
+    """
+    upper, lower = sideOrdinates(coordinates, cosineStations(stations))
+    return np.concatenate((upper, lower))
+
+
+def cosineStations(number):
+    """Stations from 0 to 1 along the chord, dense at both ends"""
+    return 0.5 * (1.0 - np.cos(np.linspace(0.0, np.pi, number)))
+
+
+def sideOrdinates(coordinates, stations):
+    """Ordinates of the upper and the lower side of a contour
+
+    Args:
+        coordinates (numpy array): Contour coordinates in Selig order with
+                                   unit chord, shape (2, n)
+        stations (numpy array): Increasing stations along the chord
+
+    Returns:
+        tuple: Ordinates of the upper and of the lower side at the stations
+    """
+    x, y = coordinates
+    le = np.argmin(x)
+
+    # upper side from the leading to the trailing edge, then lower side
+    upper = interpolateSide(x[le::-1], y[le::-1], stations)
+    lower = interpolateSide(x[le:], y[le:], stations)
+    return upper, lower
+
+
+def interpolateSide(x, y, stations):
+    """Ordinates of one side of a contour at stations along the chord
+
+    Args:
+        x (numpy array): Abscissae of the side
+        y (numpy array): Ordinates of the side
+        stations (numpy array): Increasing stations along the chord
+
+    Returns:
+        numpy array: Ordinates at the stations
+    """
+    # np.interp needs increasing abscissae, which a side may violate
+    # locally, e.g. at a rounded trailing edge
+    order = np.argsort(x, kind='mergesort')
+    return np.interp(stations, x[order], y[order])
+
+
+def leRadius(x, y):
+    """Smallest radius of curvature of a contour near its leading edge
+
+    The contour is interpolated by a cubic spline like in
+    PContourAnalysis, the radius follows from its derivatives.
+
+    Args:
+        x (numpy array): Abscissae of the contour
+        y (numpy array): Ordinates of the contour
+
+    Returns:
+        float: Leading edge radius, NaN if no spline can be fitted
+    """
+    # repeated points make the spline fit fail
+    keep = np.concatenate(([True], (np.diff(x) != 0.0) | (np.diff(y) != 0.0)))
+    x, y = x[keep], y[keep]
+    if len(x) < 4:
+        return np.nan
+
+    try:
+        tck, u = si.splprep([x, y], s=0, k=3)
+    except (ValueError, TypeError):
+        return np.nan
+
+    # parameters of the spline between the contour points near the
+    # leading edge, refined so that the smallest radius is not missed
+    near = np.flatnonzero(x <= LEREGION)
+    if len(near) == 0:
+        return np.nan
+    first, last = max(near[0] - 1, 0), min(near[-1] + 1, len(u) - 1)
+    t = np.linspace(u[first], u[last], 20 * (last - first) + 1)
+
+    xd, yd = si.splev(t, tck, der=1)
+    x2d, y2d = si.splev(t, tck, der=2)
+    n = xd**2 + yd**2
+    d = np.abs(xd*y2d - yd*x2d)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = n**(3./2.) / d
+    radius = radius[np.isfinite(radius)]
+
+    return np.min(radius) if len(radius) else np.nan
+
+
+def indexContour(filename):
+    """Read a contour file and compute its properties
+
+    Runs in the worker processes of AirfoilIndex.update.
+
+    Args:
+        filename (str): Airfoil contour file
+
+    Returns:
+        tuple: filename, dict of properties, shape features and error
+               message (None for the properties and features or for the
+               error message)
+    """
+    try:
+        coordinates = PContourReader.readContour(filename)
+        with np.errstate(all='ignore'):
+            geometry = contourGeometry(coordinates)
+            features = shapeFeatures(coordinates)
+    except Exception as error:
+        return filename, None, None, str(error).replace('\n', ' ')
+    return filename, geometry, features, None
+
+
+class AirfoilIndex(object):
+    """Properties of the contours of an airfoil library in SQLite
+
+    There is one row per contour file. Files which could not be read keep
+    their error message and are not returned by queries.
+
+    The shape features are written to a matrix file next to the database
+    (same name ending with _features.npy) after each update.
+
+    Args:
+        filename (str, optional): Database file, created if missing
+    """
+
+    def __init__(self, filename=AIRFOILINDEX):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.featurefile = os.path.splitext(filename)[0] + '_features.npy'
+        # KD-tree of the shape features and the row ids of its points
+        self.tree = None
+        self.ids = None
+
+        self.connection = sqlite3.connect(filename)
+        # the GUI queries the index while it is updated in a thread
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = OFF')
+
+        # the index can always be rebuilt, so an old layout is dropped
+        version = self.connection.execute('PRAGMA user_version').fetchone()
+        if version[0] != INDEXVERSION:
+            self.connection.execute('DROP TABLE IF EXISTS airfoils')
+            self.connection.execute('PRAGMA user_version = %d' %
+                                    (INDEXVERSION))
+
+        self.connection.execute('CREATE TABLE IF NOT EXISTS airfoils '
+                                '(path TEXT PRIMARY KEY, name TEXT, '
+                                'mtime REAL, size INTEGER, error TEXT, '
+                                'features BLOB, %s)' %
+                                (', '.join('%s REAL' % (column)
+                                           for column in PROPERTIES)))
+        for column in ['thickness', 'camber']:
+            self.connection.execute('CREATE INDEX IF NOT EXISTS '
+                                    'airfoils_%s ON airfoils (%s)' %
+                                    (column, column))
+        self.connection.commit()
+
+    def update(self, path=AIRFOILDATA, processes=None, progress=None):
+        """Index new and changed contour files below a directory
+
+        Rows of files which were removed from the directory are deleted.
+        The matrix of the shape features is rewritten if a row changed.
+
+        Args:
+            path (str, optional): Root of the airfoil directory tree
+            processes (int, optional): Number of worker processes
+                (default is the number of CPUs)
+            progress (function, optional): Callback progress(text, fraction)
+
+        Returns:
+            tuple: Numbers of indexed and of removed files
+        """
+        root = self.getPath(path).rstrip(os.sep) + os.sep
+        known = dict((row[0], (row[1], row[2])) for row in
+                     self.connection.execute(
+                         'SELECT path, mtime, size FROM airfoils '
+                         'WHERE substr(path, 1, ?) = ?', (len(root), root)))
+
+        stale = list()
+        found = set()
+        for filename in PContourReader.findContours(path):
+            key = self.getPath(filename)
+            stat = os.stat(filename)
+            found.add(key)
+            if known.get(key) != (stat.st_mtime, stat.st_size):
+                stale.append(filename)
+
+        removed = [(key, ) for key in known if key not in found]
+        with self.connection:
+            self.connection.executemany('DELETE FROM airfoils WHERE path = ?',
+                                        removed)
+
+        if not stale:
+            if removed or not os.path.exists(self.featurefile):
+                self.writeFeatures()
+            return 0, len(removed)
+
+        if processes is None:
+            processes = min(multiprocessing.cpu_count(),
+                            len(stale) // CHUNKSIZE + 1)
+        pool = multiprocessing.Pool(processes) if processes > 1 else None
+        try:
+            if pool is not None:
+                results = pool.imap_unordered(indexContour, stale, CHUNKSIZE)
+            else:
+                results = (indexContour(filename) for filename in stale)
+
+            rows = list()
+            for i, result in enumerate(results):
+                rows.append(self.makeRow(*result))
+                if len(rows) >= 256:
+                    self.insert(rows)
+                    rows = list()
+                if progress is not None and i % CHUNKSIZE == 0:
+                    progress('indexing %s' % (os.path.basename(result[0])),
+                             float(i) / len(stale))
+            self.insert(rows)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        self.writeFeatures()
+
+        return len(stale), len(removed)
+
+    @staticmethod
+    def getPath(filename):
+        """Absolute path of a file as text for SQLite"""
+        path = os.path.abspath(filename)
+        if isinstance(path, bytes):
+            path = path.decode(sys.getfilesystemencoding())
+        return path
+
+    def makeRow(self, filename, geometry, features, error):
+        """Row of the airfoils table for the result of indexContour"""
+        stat = os.stat(filename)
+        path = self.getPath(filename)
+        name = os.path.splitext(os.path.basename(path))[0]
+        if features is not None:
+            features = sqlite3.Binary(
+                np.asarray(features, dtype=np.float32).tostring())
+        values = [None] * len(PROPERTIES) if geometry is None else \
+            [float(geometry[column]) for column in PROPERTIES]
+        # SQLite stores NaN as NULL, which no comparison matches
+        values = [None if value is not None and np.isnan(value) else value
+                  for value in values]
+        return tuple([path, name, stat.st_mtime, stat.st_size, error,
+                      features] + values)
+
+    def insert(self, rows):
+        """Insert or replace rows of the airfoils table"""
+        columns = ['path', 'name', 'mtime', 'size', 'error',
+                   'features'] + PROPERTIES
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO airfoils (%s) VALUES (%s)' %
+                (', '.join(columns), ', '.join(['?'] * len(columns))), rows)
+
+    def query(self, text, limit=None):
+        """Contour files matching a query
+
+        The query is a list of terms separated by blanks, all of which
+        must hold:
+            property<value, property<=value, property>value,
+            property>=value, property=low..high (both included)
+        with a property from PROPERTIES and the value in percent of the
+        chord. Any other word must be part of the file name (the case is
+        ignored).
+
+        Args:
+            text (str): Query, e.g. 'thickness=9..10 camber>2'
+            limit (int, optional): Largest number of returned files
+
+        Returns:
+            list: (path, dict of properties) tuples sorted by name
+
+        Raises:
+            ValueError: If a term has an unknown property or no valid value
+        """
+        conditions = ['error IS NULL']
+        parameters = list()
+        for term in text.split():
+            match = TERM.match(term)
+            if match is None:
+                if re.search(r'[<>=]', term):
+                    raise ValueError('invalid term %s' % (term))
+                conditions.append("name LIKE ? ESCAPE '\\'")
+                word = re.sub(r'([\\%_])', r'\\\1', term)
+                parameters.append('%' + word + '%')
+                continue
+
+            column, operator, value, high = match.groups()
+            if column not in PROPERTIES:
+                raise ValueError('unknown property %s, use one of %s' %
+                                 (column, ', '.join(PROPERTIES)))
+            if high is not None and operator != '=':
+                raise ValueError('invalid term %s' % (term))
+            if operator == '=':
+                low = float(value)
+                high = low if high is None else float(high)
+                conditions.append('%s BETWEEN ? AND ?' % (column))
+                parameters.extend([low / 100.0, high / 100.0])
+            else:
+                conditions.append('%s %s ?' % (column, operator))
+                parameters.append(float(value) / 100.0)
+
+        sql = 'SELECT path, %s FROM airfoils WHERE %s ORDER BY name' % \
+            (', '.join(PROPERTIES), ' AND '.join(conditions))
+        if limit is not None:
+            sql += ' LIMIT %d' % (limit)
+
+        return [(row[0], dict(zip(PROPERTIES, row[1:])))
+                for row in self.connection.execute(sql, parameters)]
+
+    def writeFeatures(self):
+        """Write the shape features of all valid rows to the matrix file
+
+        The file holds a structured array with the row id and the
+        features of each contour. It is written to a temporary file
+        first, so readers never see a partly written matrix.
+        """
+        dtype = np.dtype([('id', np.int64),
+                          ('features', np.float32, (2 * FEATURESTATIONS, ))])
+        count = self.connection.execute(
+            'SELECT COUNT(*) FROM airfoils WHERE features IS NOT NULL'
+            ).fetchone()[0]
+
+        temporary = self.featurefile + '.tmp'
+        matrix = np.lib.format.open_memmap(temporary, mode='w+', dtype=dtype,
+                                           shape=(count, ))
+        rows = self.connection.execute(
+            'SELECT rowid, features FROM airfoils WHERE features IS NOT NULL '
+            'ORDER BY rowid')
+        for i, (rowid, features) in enumerate(rows):
+            if i == count:
+                break
+            matrix[i] = (rowid, np.frombuffer(features, dtype=np.float32))
+        matrix.flush()
+        del matrix
+
+        # os.rename does not replace files on Windows
+        if os.path.exists(self.featurefile):
+            os.remove(self.featurefile)
+        os.rename(temporary, self.featurefile)
+
+    def loadFeatures(self):
+        """Build the KD-tree from the memory-mapped matrix file
+
+        The tree keeps a copy of the features, so the file is not held
+        open and can be rewritten by an update.
+        """
+        matrix = np.load(self.featurefile, mmap_mode='r')
+        self.ids = np.array(matrix['id'])
+        features = np.array(matrix['features'], dtype=np.float64)
+        del matrix
+        self.tree = scipy.spatial.cKDTree(features, balanced_tree=False)
+
+    def resetFeatures(self):
+        """Reload the matrix file on the next search, e.g. after update"""
+        self.tree = None
+        self.ids = None
+
+    def nearest(self, coordinates, k=20):
+        """Contour files with the most similar shapes
+
+        Args:
+            coordinates (numpy array): Normalized contour in Selig order,
+                                       shape (2, n)
+            k (int, optional): Number of returned files
+
+        Returns:
+            list: (path, distance) tuples with increasing distance, the
+                  distance is that of the shape feature vectors
+        """
+        if self.tree is None:
+            if not os.path.exists(self.featurefile):
+                return list()
+            self.loadFeatures()
+
+        k = min(k, len(self.ids))
+        if k == 0:
+            return list()
+
+        with np.errstate(all='ignore'):
+            features = shapeFeatures(coordinates)
+        distances, rows = self.tree.query(features, k=k)
+        distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+
+        ids = [int(i) for i in self.ids[rows]]
+        paths = dict(self.connection.execute(
+            'SELECT rowid, path FROM airfoils WHERE rowid IN (%s)' %
+            (', '.join(['?'] * len(ids))), ids))
+
+        # rows deleted since the matrix was loaded are left out
+        return [(paths[i], distance) for i, distance in zip(ids, distances)
+                if i in paths]
+
+    def close(self):
+        self.connection.close()
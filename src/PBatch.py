@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+
+"""
+Batch panel analysis of an airfoil database.
+
+Walks an airfoil directory tree, runs the source-vortex panel method
+(PSvpSolver) for a list of angles of attack on every contour and writes
+one consolidated polar table. The airfoils are distributed over a pool
+of worker processes. Qt is not needed, so this runs on headless machines.
+
+Example:
+    $ python PBatch.py ../data/Airfoils --sweep -5 10 0.5 -n 160 \\
+          -o polars.csv
+"""
+
+import sys
+import csv
+import time
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import PSvpSolver
+import PContourReader
+
+
+def analyzeContour(args):
+    """Run the panel method for all angles of attack on one contour
+
+    Args:
+        args (tuple): filename, alphas, npanel, u_inf
+
+    Returns:
+        tuple: filename, lift coefficients (one per alpha), status string
+    """
+    filename, alphas, npanel, u_inf = args
+
+    cl = np.empty(len(alphas))
+    cl.fill(np.nan)
+
+    try:
+        x, y = PContourReader.readContour(filename)
+        polar, cp = PSvpSolver.compute_polar(x, y, alphas, npanel=npanel,
+                                             u_inf=u_inf)
+        cl[:] = polar
+    except Exception as error:
+        return filename, cl, 'error: %s' % (str(error).replace('\n', ' '))
+
+    if not np.all(np.isfinite(cl)):
+        return filename, cl, 'error: solution not finite'
+
+    return filename, cl, 'ok'
+
+
+def runBatch(filenames, alphas, npanel=40, u_inf=1.0, processes=None):
+    """Analyze a list of contour files in a process pool
+
+    Args:
+        filenames (list): Airfoil contour files
+        alphas (list): Angles of attack in degrees
+        npanel (int, optional): Number of panels
+        u_inf (float, optional): Freestream velocity
+        processes (int, optional): Number of worker processes
+            (default is the number of CPUs)
+
+    Returns:
+        list: (filename, cl, status) tuples in the order of filenames
+    """
+    tasks = [(filename, alphas, npanel, u_inf) for filename in filenames]
+
+    pool = multiprocessing.Pool(processes)
+    results = list()
+    try:
+        for i, result in enumerate(pool.imap(analyzeContour, tasks)):
+            results.append(result)
+            print ('[%d/%d] %s %s' % (i+1, len(tasks), result[2], result[0]))
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def writeCSV(filename, results, alphas):
+    """Write the polar table as CSV (one row per contour file)"""
+    with open(filename, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'status'] +
+                        ['cl(%g)' % (alpha) for alpha in alphas])
+        for name, cl, status in results:
+            writer.writerow([name, status] + ['%.6f' % (c) for c in cl])
+
+
+def writeNPZ(filename, results, alphas):
+    """Write the polar table as numpy NPZ archive"""
+    np.savez(filename,
+             files=np.array([result[0] for result in results]),
+             status=np.array([result[2] for result in results]),
+             alphas=np.asarray(alphas, dtype=float),
+             cl=np.array([result[1] for result in results]).reshape(
+                 len(results), len(alphas)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Batch panel analysis of an airfoil database')
+    parser.add_argument('path',
+                        help='root of the airfoil directory tree')
+    parser.add_argument('-a', '--alphas', type=float, nargs='+',
+                        default=[0.0],
+                        help='angles of attack in degrees')
+    parser.add_argument('--sweep', type=float, nargs=3,
+                        metavar=('START', 'STOP', 'STEP'),
+                        help='angles of attack from START to STOP (included)')
+    parser.add_argument('-n', '--panels', type=int, default=40,
+                        help='number of panels (default 40)')
+    parser.add_argument('-u', '--uinf', type=float, default=1.0,
+                        help='freestream velocity (default 1.0)')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('-o', '--output', default='polars.csv',
+                        help='output file, *.csv or *.npz')
+    args = parser.parse_args()
+
+    if args.sweep:
+        start, stop, step = args.sweep
+        alphas = np.arange(start, stop + 0.5*step, step).tolist()
+    else:
+        alphas = args.alphas
+
+    filenames = PContourReader.findContours(args.path)
+    if not filenames:
+        print ('No airfoil contour files found in %s' % (args.path))
+        sys.exit(1)
+
+    start = time.time()
+    results = runBatch(filenames, alphas, npanel=args.panels,
+                       u_inf=args.uinf, processes=args.processes)
+
+    if args.output.lower().endswith('.npz'):
+        writeNPZ(args.output, results, alphas)
+    else:
+        writeCSV(args.output, results, alphas)
+
+    failed = len([result for result in results if result[2] != 'ok'])
+    print ('%d contours, %d angles of attack, %d failed, %.1f s' %
+           (len(results), len(alphas), failed, time.time() - start))
+    print ('Polar table written to %s' % (args.output))
+
+
+if __name__ == '__main__':
+    main()
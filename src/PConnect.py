@@ -1,121 +1,262 @@
 import numpy as np
-import scipy.spatial as ssp
-
-from PyQt4 import QtGui, QtCore
 
 
 class Connect(object):
-    """docstring for Export"""
-    def __init__(self):
-        super(Connect, self).__init__()
+    """Stitch the blocks of a mesh to one unstructured mesh
 
-        # get MainWindow instance here (overcomes handling parents)
-        self.mainwindow = QtCore.QCoreApplication.instance().mainwindow
+    Args:
+        progress (function, optional): Called with a text and the done
+            fraction for each block; may raise an exception to cancel
+            (see PMeshing.Windtunnel.report)
+    """
+    def __init__(self, progress=None):
+        super(Connect, self).__init__()
+        self.progress = progress
 
     def getVertices(self, block):
-        vertices = list()
-        for uline in block.getULines():
-            vertices += uline
-        return vertices
+        """Vertices of a block (u-lines one after another)
+
+        Args:
+            block (BlockMesh): Block
+
+        Returns:
+            numpy array: float64 vertex coordinates with shape (n, 2)
+        """
+        return np.array(block.getULines().reshape(-1, 2), dtype=np.float64)
 
     def getConnectivity(self, block):
+        """Quad cells of a block
 
-        connectivity = list()
+        Cells are ordered by u and then by v. The vertices of a cell are
+        (u, v), (u, v+1), (u+1, v+1), (u+1, v) numbered as in getVertices.
 
+        Args:
+            block (BlockMesh): Block
+
+        Returns:
+            numpy array: int32 vertex numbers with shape (ncells, 4)
+        """
         U, V = block.getDivUV()
         up = U + 1
-        for u in range(U):
-            for v in range(V):
-                p1 = v * up + u
-                p2 = p1 + up
-                p3 = p2 + 1
-                p4 = p1 + 1
-                connectivity.append((p1, p2, p3, p4))
-
-        return connectivity
-
-    def getNearestNeighbours(self, vertices, radius=0.001):
-        V = np.array(vertices)
-        tree = ssp.cKDTree(V)
-        pairs = tree.query_pairs(radius, p=2., eps=0)
-        return pairs
-
-    def connectAllBlocks(self, blocks):
-
-        progdialog = QtGui.QProgressDialog(
-            "", "Cancel", 0, 3, self.mainwindow)
-        progdialog.setWindowTitle('Connect mesh blocks')
-        progdialog.setWindowModality(QtCore.Qt.WindowModal)
-        progdialog.show()
-
-        progdialog.setValue(0)
-        progdialog.setLabelText('connecting part 1/3')
-
-        connected_1 = self.connectBlocks(blocks[0], blocks[1],
-                                         radius=0.0001, type_='block')
-        progdialog.setValue(1)
-
-        if progdialog.wasCanceled():
-            return
-        progdialog.setLabelText('connecting part 2/3')
-
-        connected_2 = self.connectBlocks(blocks[2], blocks[3],
-                                         radius=0.0001, type_='block')
-
-        progdialog.setValue(2)
-
-        if progdialog.wasCanceled():
-            return
-        progdialog.setLabelText('connecting part 3/3')
-
-        connected = self.connectBlocks(connected_1, connected_2,
-                                       radius=0.0001, type_='connected')
-
-        progdialog.setValue(3)
-
-        return connected
-
-    def connectBlocks(self, block_1, block_2, radius=0.001, type_='block'):
-
-        if type_ == 'block':
-            vertices_1 = self.getVertices(block_1)
-            vertices_2 = self.getVertices(block_2)
-            connectivity_1 = self.getConnectivity(block_1)
-            connectivity_2 = self.getConnectivity(block_2)
-        if type_ == 'connected':
-            vertices_1, connectivity_1 = block_1
-            vertices_2, connectivity_2 = block_2
-
-        vertices = vertices_1 + vertices_2
-        lv1 = len(vertices_1)
-
-        connectivity_2mod = list()
-        for cell in connectivity_2:
-            new_cell = [vertex+lv1 for vertex in cell]
-            connectivity_2mod.append(new_cell)
-
-        pairs = self.getNearestNeighbours(vertices, radius=radius)
-        pairs = list(pairs)
-        I, J = zip(*pairs)
-
-        # this is dirty, but seems to work
-        # vertices which are not used need somehow to be
-        # "removed" without removing them
-        # so that they later can not be found again in nearest neighbour search
-        for vertex_id in J:
-            vertices[vertex_id] = (15.+np.random.random_sample(),
-                                   15.+np.random.random_sample())
-
-        connectivity_2_new = list()
-        for cell in connectivity_2mod:
-            new_cell = list()
-            for vertex in cell:
-                new_vertex = vertex
-                if vertex in J:
-                    new_vertex = I[J.index(vertex)]
-                new_cell.append(new_vertex)
-            connectivity_2_new.append(new_cell)
-
-        connectivity = connectivity_1 + connectivity_2_new
+        u, v = np.meshgrid(np.arange(U, dtype=np.int32),
+                           np.arange(V, dtype=np.int32), indexing='ij')
+        p1 = (v * up + u).ravel()
+        p2 = p1 + up
+        p3 = p2 + 1
+        p4 = p1 + 1
+        return np.column_stack((p1, p2, p3, p4))
+
+    @staticmethod
+    def getNodeNumbers(block, nodes):
+        """Numbers of nodes within a block (u-lines one after another)
+
+        Args:
+            block (BlockMesh): Block
+            nodes (numpy array): (i, j) indices of the nodes, shape (n, 2)
+
+        Returns:
+            numpy array: Node numbers as used by getVertices
+        """
+        U, V = block.getDivUV()
+        return nodes[:, 1] * (U + 1) + nodes[:, 0]
+
+    def getBlockEdges(self, block):
+        """Edges on the four sides of a block
+
+        Args:
+            block (BlockMesh): Block
+
+        Returns:
+            numpy array: Node numbers (as used by getVertices) with shape
+                         (n, 2), oriented like the cells of the block
+        """
+        U, V = block.getDivUV()
+        cells = self.getConnectivity(block).reshape(U, V, 4)
+        return np.concatenate((cells[:, 0][:, [3, 0]],
+                               cells[:, -1][:, [1, 2]],
+                               cells[0][:, [0, 1]],
+                               cells[-1][:, [2, 3]]))
+
+    def iterBlocks(self, blocks, interfaces):
+        """Vertex numbers of the nodes of each block, block by block
+
+        Shared nodes get the vertex number of the node of the block
+        generated first, all other nodes are numbered consecutively in
+        the order of the blocks. Only the numbers of the nodes on
+        interfaces to later blocks are kept between blocks.
+
+        Args:
+            blocks (list): BlockMesh instances in the order of generation
+            interfaces (list): Shared nodes as recorded by
+                               PMeshing.Windtunnel.addInterfaces
+
+        Yields:
+            tuple: block, vertex numbers of its nodes (numbered as in
+                   getVertices) and mask of the nodes which are new
+                   vertices, i.e. not shared with an earlier block
+        """
+        # vertex numbers of the earlier block of each interface
+        pending = dict()
+        nvertices = 0
+        for number, block in enumerate(blocks):
+            if self.progress:
+                self.progress('connecting %s' % (block.name),
+                              number / float(len(blocks)))
+
+            numbers = np.empty(block.nodes.size // 2, dtype=np.int64)
+            numbers.fill(-1)
+            for k, (block_1, nodes_1, block_2, nodes_2) in \
+                    enumerate(interfaces):
+                if block_2 is block:
+                    numbers[self.getNodeNumbers(block, nodes_2)] = \
+                        pending.pop(k)
+
+            new = numbers < 0
+            count = np.count_nonzero(new)
+            numbers[new] = np.arange(nvertices, nvertices + count)
+            nvertices += count
+
+            for k, (block_1, nodes_1, block_2, nodes_2) in \
+                    enumerate(interfaces):
+                if block_1 is block:
+                    pending[k] = numbers[self.getNodeNumbers(block, nodes_1)]
+
+            yield block, numbers, new
+
+    def connectAllBlocks(self, blocks, interfaces):
+        """Stitch all blocks by the shared nodes recorded during generation
+
+        Shared nodes are mapped onto the node of the block generated
+        first, so stitching is a pure index remap (see iterBlocks).
+
+        Args:
+            blocks (list): BlockMesh instances in the order of generation
+            interfaces (list): Shared nodes as recorded by
+                               PMeshing.Windtunnel.addInterfaces
+
+        Returns:
+            tuple: vertices (float64 array with shape (n, 2)) and
+                   connectivity (int32 array with shape (ncells, 4))
+        """
+        vertices = list()
+        connectivity = list()
+
+        # vertex numbers of the nodes of each block, see getMarkers
+        self.numbers = dict()
+
+        for block, numbers, new in self.iterBlocks(blocks, interfaces):
+            self.numbers[id(block)] = numbers
+            vertices.append(self.getVertices(block)[new])
+            connectivity.append(numbers[self.getConnectivity(block)])
+
+        vertices = np.concatenate(vertices)
+        connectivity = np.concatenate(connectivity).astype(np.int32)
 
         return (vertices, connectivity)
+
+    def getMarkers(self, boundaries):
+        """Vertex numbers of the boundaries of the mesh
+
+        Must be called after connectAllBlocks.
+
+        Args:
+            boundaries (dict): Boundary nodes of the blocks as recorded by
+                               PMeshing.Windtunnel.addBoundary
+
+        Returns:
+            dict: Vertex numbers (numpy array) for each boundary
+        """
+        markers = dict()
+        for tag, parts in boundaries.items():
+            vertices = [self.numbers[id(block)][
+                self.getNodeNumbers(block, nodes)] for block, nodes in parts]
+            markers[tag] = np.unique(np.concatenate(vertices))
+        return markers
+
+
+class MeshStream(Connect):
+    """Connected mesh which is generated block by block while exporting
+
+    The exporters in PMeshing.BlockMesh take it instead of the
+    (vertices, connectivity) tuple of connectAllBlocks. Vertices and cells
+    come one block at a time, so the whole mesh is never held in memory.
+
+    Args:
+        blocks (list): BlockMesh instances in the order of generation
+        interfaces (list): Shared nodes as recorded by
+                           PMeshing.Windtunnel.addInterfaces
+        boundaries (dict, optional): Boundary nodes as recorded by
+                                     PMeshing.Windtunnel.addBoundary
+        progress (function, optional): See Connect
+    """
+    def __init__(self, blocks, interfaces, boundaries=None, progress=None):
+        super(MeshStream, self).__init__(progress=progress)
+        self.blocks = blocks
+        self.interfaces = interfaces
+        self.boundaries = boundaries or dict()
+
+        # shared nodes of each block which are vertices of an earlier block
+        shared = dict()
+        for block_1, nodes_1, block_2, nodes_2 in interfaces:
+            shared.setdefault(id(block_2), []).append(
+                self.getNodeNumbers(block_2, nodes_2))
+
+        self.nvertices = sum(block.nodes.size // 2 for block in blocks) - \
+            sum(len(np.unique(np.concatenate(numbers)))
+                for numbers in shared.values())
+        self.ncells = sum(np.prod(block.getDivUV()) for block in blocks)
+
+    def iterVertices(self):
+        """Vertices block by block, see connectAllBlocks"""
+        for block, numbers, new in self.iterBlocks(self.blocks,
+                                                   self.interfaces):
+            yield self.getVertices(block)[new]
+
+    def iterCells(self):
+        """Connectivity block by block, see connectAllBlocks"""
+        for block, numbers, new in self.iterBlocks(self.blocks,
+                                                   self.interfaces):
+            yield numbers[self.getConnectivity(block)].astype(np.int32)
+
+    def getMarkers(self):
+        """Vertex numbers of the boundaries of the mesh
+
+        Returns:
+            dict: Vertex numbers (numpy array) for each boundary
+        """
+        vertices = dict((tag, [np.zeros(0, dtype=np.int64)])
+                        for tag in self.boundaries)
+        for block, numbers, new in self.iterBlocks(self.blocks,
+                                                   self.interfaces):
+            for tag, parts in self.boundaries.items():
+                vertices[tag] += [numbers[self.getNodeNumbers(block, nodes)]
+                                  for part, nodes in parts if part is block]
+
+        return dict((tag, np.unique(np.concatenate(vertices[tag])))
+                    for tag in vertices)
+
+    def getMarkerEdges(self):
+        """Boundary edges of the mesh sorted by marker
+
+        The edges of a marker are the edges on the sides of the blocks
+        which connect two of its recorded boundary nodes.
+
+        Returns:
+            dict: Vertex numbers of the boundary edges with shape (n, 2),
+                  oriented like the cells, for each marker
+        """
+        edges = dict((tag, [np.zeros((0, 2), dtype=np.int64)])
+                     for tag in self.boundaries)
+        for block, numbers, new in self.iterBlocks(self.blocks,
+                                                   self.interfaces):
+            sides = self.getBlockEdges(block)
+            for tag, parts in self.boundaries.items():
+                for part, nodes in parts:
+                    if part is not block:
+                        continue
+                    on_part = np.in1d(sides, self.getNodeNumbers(block,
+                                                                 nodes))
+                    on_part = on_part.reshape(sides.shape).all(axis=1)
+                    edges[tag].append(numbers[sides[on_part]])
+
+        return dict((tag, np.concatenate(edges[tag])) for tag in edges)
@@ -0,0 +1,279 @@
+"""
+Qt-free reader for airfoil contour files.
+
+Used where the GUI classes (PAirfoil) are not available, e.g. in the
+batch panel analysis (PBatch) and its worker processes. PAirfoil reads
+its contours here as well.
+
+Both common formats are detected:
+   - Selig: one line per point, from the trailing edge over the upper
+     side and the leading edge back to the trailing edge
+   - Lednicer: a line with the numbers of points of the upper and lower
+     side, followed by the upper and then the lower side, both from the
+     leading to the trailing edge
+Lines which do not start with two numbers, like the airfoil name or
+other header lines, are skipped.
+
+findContours collects the contour files of a directory tree, e.g. for
+the batch analysis and the airfoil index (PAirfoilIndex).
+
+Parsed contours can be kept in a ContourCache, so that files which did
+not change since they were read are not parsed again.
+"""
+
+import os
+import re
+import sys
+import fnmatch
+import sqlite3
+
+import numpy as np
+
+from PSettings import CONTOURCACHE
+
+
+# two numbers at the beginning of a line, i.e. the coordinates of a point
+# (or the numbers of points in the header of a Lednicer file)
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+POINT = re.compile(r'^[ \t]*(%s)[ \t,;]+(%s)(?![\w.])' % (NUMBER, NUMBER),
+                   re.MULTILINE)
+
+# airfoil contour files, see DIALOGFILTER in PSettings
+PATTERNS = ['*.dat', '*.txt']
+
+# cache used by readContour when called with cache=True
+_cache = None
+
+
+def parseContour(text, comment='#'):
+    """Contour points from the text of a contour file
+
+    Args:
+        text (str): Content of a Selig or Lednicer file
+        comment (str, optional): Lines containing it are skipped
+
+    Returns:
+        numpy array: Contour coordinates in Selig order, shape (2, n)
+
+    Raises:
+        ValueError: If the text does not contain a valid contour
+    """
+    lines = text.splitlines()
+    if comment and comment in text:
+        lines = [line for line in lines if comment not in line]
+
+    # skip name and header lines before the first point
+    start = 0
+    while start < len(lines) and not POINT.match(lines[start]):
+        start += 1
+    lines = lines[start:]
+
+    points = parseColumns(lines)
+    if points is None:
+        # more header lines or rows of different length, so take the
+        # lines starting with two numbers
+        points = np.array(POINT.findall('\n'.join(lines)),
+                          dtype=np.float64).reshape(-1, 2)
+
+    if len(points) and isLednicer(points):
+        upper = int(points[0, 0])
+        points = points[1:]
+        # upper side from the trailing edge, then the lower side
+        lower = points[upper:]
+        if np.all(lower[0] == points[0]):
+            lower = lower[1:]
+        points = np.concatenate((points[upper - 1::-1], lower))
+
+    if len(points) < 3:
+        raise ValueError('contains less than 3 contour points')
+
+    return points.T
+
+
+def parseColumns(lines):
+    """Parse lines which all hold the same number of numbers
+
+    All numbers are converted at once by numpy.
+
+    Args:
+        lines (list): Lines of a contour file, blank lines are skipped
+
+    Returns:
+        numpy array: First two columns with shape (n, 2), None if the
+                     lines are not a table of at least two columns
+    """
+    rows = [line for line in lines if line.strip()]
+    if not rows:
+        return np.zeros((0, 2))
+
+    columns = len(rows[0].split())
+    values = np.fromstring(' '.join(rows), sep=' ')
+    if columns < 2 or values.size != columns * len(rows):
+        return None
+
+    return values.reshape(-1, columns)[:, :2]
+
+
+def isLednicer(points):
+    """Check for the numbers of points in the first line of a Lednicer file
+
+    Args:
+        points (numpy array): Parsed lines with shape (n, 2)
+
+    Returns:
+        bool: True if the first line holds the numbers of points of the
+              upper and the lower side
+    """
+    upper, lower = points[0]
+    counts = upper > 1.0 and lower > 1.0 and \
+        upper == int(upper) and lower == int(lower)
+    return bool(counts and upper + lower == len(points) - 1)
+
+
+def normalizeContour(coordinates):
+    """Shift and scale a contour to unit chord (in place)
+
+    Args:
+        coordinates (numpy array): Contour coordinates with shape (2, n)
+
+    Returns:
+        numpy array: The normalized coordinates
+    """
+    coordinates[0] -= np.min(coordinates[0])
+    divisor = np.max(coordinates[0])
+    coordinates[0] /= divisor
+    coordinates[1] /= divisor
+    return coordinates
+
+
+def readContour(filename, comment='#', cache=None):
+    """Read an airfoil contour and normalize it to unit chord
+
+    Selig and Lednicer files are detected automatically (see
+    parseContour).
+
+    Args:
+        filename (str): Airfoil contour file
+        comment (str, optional): Comment character
+        cache (ContourCache or bool, optional): Cache of parsed contours,
+            True for the cache in CONTOURCACHE
+
+    Returns:
+        numpy array: Normalized contour coordinates with shape (2, n)
+
+    Raises:
+        IOError: If the file can not be read
+        ValueError: If the file does not contain a valid contour
+    """
+    if cache is True:
+        cache = defaultCache()
+
+    if cache is not None:
+        coordinates = cache.get(filename)
+        if coordinates is not None:
+            return coordinates
+
+    with open(filename, mode='r') as f:
+        text = f.read()
+
+    try:
+        coordinates = normalizeContour(parseContour(text, comment))
+    except ValueError as error:
+        raise ValueError('Unable to parse file %s. Error was: %s' %
+                         (filename, error))
+
+    if cache is not None:
+        cache.put(filename, coordinates)
+
+    return coordinates
+
+
+def findContours(path, patterns=PATTERNS):
+    """Collect all airfoil contour files below a directory
+
+    Args:
+        path (str): Root of the airfoil directory tree
+        patterns (list, optional): File name patterns of contour files
+
+    Returns:
+        list: Sorted list of file names
+    """
+    filenames = list()
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+                filenames.append(os.path.join(root, name))
+    return sorted(filenames)
+
+
+def defaultCache():
+    """The ContourCache in CONTOURCACHE, opened on first use"""
+    global _cache
+    if _cache is None:
+        _cache = ContourCache()
+    return _cache
+
+
+class ContourCache(object):
+    """Parsed and normalized contours in an SQLite database
+
+    There is one row per file. A contour is valid as long as the
+    modification time and the size of its file do not change.
+
+    Args:
+        filename (str, optional): Database file, created if missing
+    """
+
+    def __init__(self, filename=CONTOURCACHE):
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(filename)
+        # the cache can always be rebuilt, so it is not synced to disk
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS contours '
+                                '(path TEXT PRIMARY KEY, mtime REAL, '
+                                'size INTEGER, coordinates BLOB)')
+
+    @staticmethod
+    def getKey(filename):
+        """Absolute path, modification time and size of a file"""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        # SQLite takes text, not the bytes of a Python 2 str
+        if isinstance(path, bytes):
+            path = path.decode(sys.getfilesystemencoding())
+        return path, stat.st_mtime, stat.st_size
+
+    def get(self, filename):
+        """Cached contour of a file
+
+        Args:
+            filename (str): Airfoil contour file
+
+        Returns:
+            numpy array: Contour coordinates with shape (2, n), None if
+                         the file is not cached or has changed
+        """
+        row = self.connection.execute(
+            'SELECT coordinates FROM contours '
+            'WHERE path = ? AND mtime = ? AND size = ?',
+            self.getKey(filename)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float64).reshape(2, -1).copy()
+
+    def put(self, filename, coordinates):
+        """Store the contour of a file
+
+        Args:
+            filename (str): Airfoil contour file
+            coordinates (numpy array): Contour coordinates with shape (2, n)
+        """
+        coordinates = np.ascontiguousarray(coordinates, dtype=np.float64)
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO contours VALUES (?, ?, ?, ?)',
+                self.getKey(filename) +
+                (sqlite3.Binary(coordinates.tostring()), ))
@@ -1,7 +1,12 @@
+import os
+import sqlite3
+
 from PyQt4 import QtGui, QtCore
 
 from PSettings import AIRFOILDATA, FILEFILTER, ICONS_L
 import PLogger as logger
+import PAirfoilIndex
+import PWorker
 
 
 class FileSystem(QtGui.QFileSystemModel):
@@ -36,6 +41,110 @@ class FileSystem(QtGui.QFileSystemModel):
         header = self.tree.header()
         header.setResizeMode(QtGui.QHeaderView.ResizeToContents)
 
+        # query box, its results replace the tree while it is not empty
+        self.query = QtGui.QLineEdit()
+        self.query.setToolTip('Filter the airfoils, e.g. ' +
+                              '"thickness=9..10 camber>2 naca"\n' +
+                              'Properties in percent of the chord: ' +
+                              ', '.join(PAirfoilIndex.PROPERTIES))
+        self.query.textChanged.connect(self.onQuery)
+
+        self.similar = QtGui.QPushButton('Similar')
+        self.similar.setToolTip('Airfoils of the library with the most ' +
+                                'similar shape to the selected airfoil')
+        self.similar.clicked.connect(self.onSimilar)
+
+        self.results = QtGui.QListWidget()
+        self.results.setVisible(False)
+        self.results.itemDoubleClicked.connect(self.onResultLoad)
+        self.resultpaths = list()
+
+        try:
+            self.airfoilindex = PAirfoilIndex.AirfoilIndex()
+        except (sqlite3.Error, OSError) as error:
+            logger.log.info('Airfoil index not available: %s' % (error))
+            self.airfoilindex = None
+            self.query.setEnabled(False)
+            self.similar.setEnabled(False)
+        else:
+            self.updateIndex()
+
+    def updateIndex(self):
+        """Index new and changed contour files in the background"""
+        def task(progress):
+            # SQLite connections can not be shared between threads
+            airfoilindex = PAirfoilIndex.AirfoilIndex()
+            try:
+                return airfoilindex.update(AIRFOILDATA, progress=progress)
+            finally:
+                airfoilindex.close()
+
+        self.indexer = PWorker.Worker(task)
+        self.indexer.done.connect(self.onIndexUpdated)
+        self.indexer.failed.connect(self.onIndexFailed)
+        self.indexer.start()
+
+    def onIndexUpdated(self, result):
+        indexed, removed = result
+        self.airfoilindex.resetFeatures()
+        if indexed or removed:
+            logger.log.info('Airfoil index updated: %s files indexed, '
+                            '%s removed' % (indexed, removed))
+            self.onQuery(self.query.text())
+
+    def onIndexFailed(self, message):
+        logger.log.error('Airfoil index update failed: %s' % (message))
+
+    def onQuery(self, text):
+        text = unicode(text).strip()
+        self.tree.setVisible(not text)
+        self.results.setVisible(bool(text))
+        if not text:
+            return
+
+        self.results.clear()
+        self.resultpaths = list()
+        try:
+            matches = self.airfoilindex.query(text)
+        except ValueError as error:
+            self.results.addItem(str(error))
+            return
+
+        for path, geometry in matches:
+            self.resultpaths.append(path)
+            self.results.addItem('%s  (t %.1f%%, c %.1f%%)' %
+                                 (os.path.basename(path),
+                                  100.0 * geometry['thickness'],
+                                  100.0 * geometry['camber']))
+
+    def onSimilar(self):
+        selected = [airfoil for airfoil in self.parent.airfoils
+                    if airfoil.contour_item.isSelected()]
+        if not selected:
+            logger.log.info('Select an airfoil to find similar ones')
+            return
+
+        matches = self.airfoilindex.nearest(selected[0].raw_coordinates)
+
+        # the results are shown until the query box is edited
+        self.query.blockSignals(True)
+        self.query.clear()
+        self.query.blockSignals(False)
+        self.tree.setVisible(False)
+        self.results.setVisible(True)
+
+        self.results.clear()
+        self.resultpaths = list()
+        for path, distance in matches:
+            self.resultpaths.append(path)
+            self.results.addItem('%s  (distance %.4f)' %
+                                 (os.path.basename(path), distance))
+
+    def onResultLoad(self, item):
+        row = self.results.row(item)
+        if 0 <= row < len(self.resultpaths):
+            self.parent.slots.loadAirfoil(self.resultpaths[row], '#')
+
     def data(self, index, role):
         """
         This function partly overrides the standard QFileSystemModel data
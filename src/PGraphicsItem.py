@@ -1,5 +1,10 @@
+import numpy as np
+
 from PyQt4 import QtGui, QtCore
 
+from PGraphicsMesh import makePolygon
+from PSettings import MARKERSIZE, MARKERPENWIDTH
+
 
 class GraphicsItem(QtGui.QGraphicsItem):
     """
@@ -190,3 +195,87 @@ class GraphicsItem(QtGui.QGraphicsItem):
         self.pen.setWidthF(self.penwidth)
         # handle event
         super(GraphicsItem, self).hoverLeaveEvent(event)
+
+
+class MarkerItem(QtGui.QGraphicsItem):
+    """Markers of a fixed pixel size at the points of a contour
+
+    All markers are painted with two drawPoints calls using round
+    cosmetic pens, the outline and on top of it the inside. So the
+    markers keep their size when zooming without changing the item.
+    The points are mapped to device coordinates before drawing, as Qt
+    strokes a point as a short line in item coordinates, which shows
+    up as a dash at a strong zoom.
+
+    Args:
+        coordinates (numpy array): x and y coordinates with shape (2, n)
+        pencolor (QColor): Color of the marker outline
+        brushcolor (QColor): Color of the marker inside
+        parent (QGraphicsItem, optional): Parent item
+    """
+
+    def __init__(self, coordinates, pencolor, brushcolor, parent=None):
+        super(MarkerItem, self).__init__(parent)
+
+        self.points = np.transpose(coordinates).astype(np.float64)
+        xmin, ymin = np.min(self.points, axis=0)
+        xmax, ymax = np.max(self.points, axis=0)
+        self.rect = QtCore.QRectF(xmin, ymin, xmax - xmin, ymax - ymin)
+
+        # marker diameters in pixels as circles with radius MARKERSIZE
+        # and an outline of width MARKERPENWIDTH
+        self.pen = self.markerPen(pencolor, 2 * MARKERSIZE + MARKERPENWIDTH)
+        self.brushpen = self.markerPen(brushcolor,
+                                       2 * MARKERSIZE - MARKERPENWIDTH)
+
+        # markers reach beyond the points by their radius at the current
+        # zoom of the view (the parent is usually in the scene already)
+        self.updateMargin()
+
+    @staticmethod
+    def markerPen(color, width):
+        pen = QtGui.QPen(color)
+        pen.setWidth(width)
+        pen.setCapStyle(QtCore.Qt.RoundCap)
+        pen.setCosmetic(True)  # no pen thickness change when zoomed
+        return pen
+
+    def updateMargin(self):
+        """Extend the bounding rectangle by the marker radius at the
+        current zoom of the view showing the item
+        """
+        scene = self.scene()
+        if scene is None or not scene.views():
+            self.setMargin(0.0)
+            return
+
+        # map a square with side length of the marker radius including
+        # its outline to the scene coords
+        size = MARKERSIZE + MARKERPENWIDTH
+        poly = scene.views()[0].mapToScene(QtCore.QRect(0, 0, size, size))
+        self.setMargin(poly.boundingRect().width())
+
+    def setMargin(self, margin):
+        """Extend the bounding rectangle by the marker radius
+
+        Args:
+            margin (float): Marker radius in scene coordinates
+        """
+        self.prepareGeometryChange()
+        self.boundingrect = self.rect.adjusted(-margin, -margin,
+                                               margin, margin)
+
+    def boundingRect(self):
+        return self.boundingrect
+
+    def paint(self, painter, option, widget):
+        t = painter.worldTransform()
+        matrix = np.array([[t.m11(), t.m12()], [t.m21(), t.m22()]])
+        points = makePolygon(np.dot(self.points, matrix) + (t.dx(), t.dy()))
+
+        painter.resetTransform()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, True)
+        painter.setPen(self.pen)
+        painter.drawPoints(points)
+        painter.setPen(self.brushpen)
+        painter.drawPoints(points)
@@ -0,0 +1,209 @@
+"""
+Graphics item which draws a whole block mesh.
+
+The blocks are split into patches of PATCHSIZE x PATCHSIZE cells. Only
+the patches in the visible part of the scene are painted, and each patch
+is drawn with a level of detail that follows the zoom of the view: grid
+lines closer to each other than about one pixel are left out. A patch
+is painted as one polyline, which is built when it is needed and kept
+per level, so panning and zooming only build the polylines of newly
+visible patches.
+"""
+
+import numpy as np
+
+from PyQt4 import QtGui, QtCore
+
+
+# cells per side of the patches into which the blocks are split
+PATCHSIZE = 32
+
+# number of detail levels for which the patch polylines are kept
+CACHELEVELS = 4
+
+
+def makePolygon(points):
+    """Polygon from an array of points without a QPointF per point
+
+    Args:
+        points (numpy array): Point coordinates with shape (n, 2)
+
+    Returns:
+        QPolygonF: Polygon with the points
+    """
+    points = np.ascontiguousarray(points, dtype=np.float64)
+    polygon = QtGui.QPolygonF(len(points))
+
+    # the memory of a QPolygonF is an array of (x, y) doubles
+    buffer = polygon.data()
+    buffer.setsize(points.nbytes)
+    np.frombuffer(buffer, dtype=np.float64)[:] = points.ravel()
+
+    return polygon
+
+
+def lineSelection(spacing, threshold):
+    """Grid lines which are kept at a level of detail
+
+    A line is kept where the summed spacing passes the next multiple
+    of the threshold, so that on average the kept lines are at least
+    the threshold apart. The first and the last line are always kept.
+
+    Args:
+        spacing (numpy array): Largest distance of each line to the
+                               previous one
+        threshold (float): Distance of the kept lines
+
+    Returns:
+        numpy array: Indices of the kept lines
+    """
+    position = np.concatenate(([0.0], np.cumsum(spacing)))
+    bucket = np.floor(position / threshold)
+    kept = np.flatnonzero(np.diff(bucket)) + 1
+    return np.unique(np.concatenate(([0], kept, [len(position) - 1])))
+
+
+class MeshItem(QtGui.QGraphicsItem):
+    """Grid lines of mesh blocks as one graphics item
+
+    Args:
+        blocks (list): PMeshing.BlockMesh instances
+        parent (QGraphicsItem, optional): Parent item
+    """
+
+    def __init__(self, blocks, parent=None):
+        super(MeshItem, self).__init__(parent)
+
+        # node arrays, line spacings and finest level of the patches
+        self.patches = list()
+        # bounding rectangles (xmin, ymin, xmax, ymax) of the patches
+        rects = list()
+        for block in blocks:
+            nodes = block.getULines()
+            v, u = nodes.shape[0] - 1, nodes.shape[1] - 1
+            for j in range(0, v, PATCHSIZE):
+                for i in range(0, u, PATCHSIZE):
+                    patch = nodes[j:j + PATCHSIZE + 1, i:i + PATCHSIZE + 1]
+                    self.addPatch(patch)
+                    rects.append(np.concatenate((np.min(patch, axis=(0, 1)),
+                                                 np.max(patch, axis=(0, 1)))))
+        self.rects = np.array(rects).reshape(-1, 4)
+
+        # polylines of the patches for the last levels of detail and
+        # polylines with all lines, which are the same for all fine levels
+        self.cache = dict()
+        self.full = dict()
+
+        self.pen = QtGui.QPen(QtCore.Qt.SolidLine)
+        self.pen.setColor(QtGui.QColor(0, 0, 0, 255))
+        self.pen.setWidthF(0.8)
+        self.pen.setCosmetic(True)  # no pen thickness change when zoomed
+
+        # the mesh does not change, so neither does its bounding rectangle
+        xmin, ymin = np.min(self.rects[:, :2], axis=0)
+        xmax, ymax = np.max(self.rects[:, 2:], axis=0)
+        self.boundingrect = QtCore.QRectF(xmin, ymin, xmax - xmin,
+                                          ymax - ymin)
+
+        # needed for option.exposedRect in paint
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def addPatch(self, nodes):
+        """Store a patch with the spacings of its grid lines
+
+        Args:
+            nodes (numpy array): Nodes of the patch with shape (v, u, 2)
+        """
+        def distance(delta):
+            return np.sqrt(np.sum(delta * delta, axis=2))
+
+        # u-lines are rows and v-lines are columns of the nodes
+        uspacing = np.max(distance(nodes[1:] - nodes[:-1]), axis=1)
+        vspacing = np.max(distance(nodes[:, 1:] - nodes[:, :-1]), axis=0)
+
+        # up to this level all lines are kept (see lineSelection)
+        smallest = min(np.min(uspacing), np.min(vspacing))
+        finest = int(np.floor(np.log2(smallest))) if smallest > 0.0 else None
+
+        self.patches.append((nodes, uspacing, vspacing, finest))
+
+    def getPolyline(self, number, level):
+        """Polyline of a patch at a level of detail
+
+        Args:
+            number (int): Number of the patch
+            level (int): Kept lines are about 2**level apart
+
+        Returns:
+            QPolygonF: Kept grid lines of the patch
+        """
+        nodes, uspacing, vspacing, finest = self.patches[number]
+
+        if finest is not None and level <= finest:
+            if number not in self.full:
+                self.full[number] = self.makePolyline(nodes)
+            return self.full[number]
+
+        if level not in self.cache:
+            if len(self.cache) >= CACHELEVELS:
+                farthest = max(self.cache, key=lambda l: abs(l - level))
+                del self.cache[farthest]
+            self.cache[level] = dict()
+
+        polylines = self.cache[level]
+        if number not in polylines:
+            threshold = 2.0 ** level
+            rows = lineSelection(uspacing, threshold)
+            columns = lineSelection(vspacing, threshold)
+            polylines[number] = self.makePolyline(nodes[rows][:, columns])
+
+        return polylines[number]
+
+    @staticmethod
+    def makePolyline(nodes):
+        """One polyline through all u- and v-lines of a grid of nodes
+
+        The u-lines are passed back and forth, then the v-lines starting
+        at the corner where the u-lines end. So the segments joining the
+        lines are edges of the first and last u- and v-line.
+
+        Args:
+            nodes (numpy array): Grid nodes with shape (v, u, 2)
+
+        Returns:
+            QPolygonF: Polyline
+        """
+        ulines = np.array(nodes)
+        ulines[1::2] = ulines[1::2, ::-1]
+
+        # v-lines from the last to the first u-line, starting at the
+        # last v-line if the last u-line ends there
+        vlines = nodes.transpose(1, 0, 2)[:, ::-1]
+        if len(nodes) % 2 == 1:
+            vlines = vlines[::-1]
+        vlines = np.array(vlines)
+        vlines[1::2] = vlines[1::2, ::-1]
+
+        return makePolygon(np.concatenate((ulines.reshape(-1, 2),
+                                           vlines.reshape(-1, 2))))
+
+    def boundingRect(self):
+        return self.boundingrect
+
+    def paint(self, painter, option, widget):
+        # scene length of a pixel gives the level of detail
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = int(np.floor(np.log2(1.0 / scale)))
+
+        # patches intersecting the part of the item which is painted
+        rect = option.exposedRect
+        visible = np.flatnonzero((self.rects[:, 0] <= rect.right()) &
+                                 (self.rects[:, 2] >= rect.left()) &
+                                 (self.rects[:, 1] <= rect.bottom()) &
+                                 (self.rects[:, 3] >= rect.top()))
+
+        # draw the gridlines aliased, that makes them looking "sharper"
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.setPen(self.pen)
+        for number in visible:
+            painter.drawPolyline(self.getPolyline(number, level))
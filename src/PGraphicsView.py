@@ -4,7 +4,7 @@ import math
 from PyQt4 import QtGui, QtCore
 
 from PSettings import ZOOMANCHOR, SCROLLBARS, SCALEINC, MINZOOM, MAXZOOM, \
-                      MARKERSIZE, MARKERPENWIDTH, RUBBERBANDSIZE
+                      RUBBERBANDSIZE
 
 # put constraints on rubberband zoom (relative rectangle wdith)
 RUBBERBANDSIZE = min(RUBBERBANDSIZE, 1.0)
@@ -345,38 +345,15 @@ class GraphicsView(QtGui.QGraphicsView):
         self.getSceneFromView()
 
     def adjustMarkerSize(self):
-        """Adjust marker size during zoom. Marker items are circles
-        which are otherwise affected by zoom.
+        """Adjust the marker bounding rectangles during zoom. Markers
+        are painted with a fixed pixel size (PGraphicsItem.MarkerItem),
+        only their extent in scene coordinates changes with the zoom.
         """
-        # markers are drawn in PGraphicsItem using scene coordinates
-        # in order to keep them constant size, also when zooming
-        # a fixed pixel size is mapped to scene coordinates
-        # depending on the zoom, this leads to always different scene
-        # coordinates
-        # map a square with side length of MARKERSIZE to the scene coords
-        poly = self.mapToScene(QtCore.QRect(0, 0, MARKERSIZE, MARKERSIZE))
-        pw = self.mapToScene(QtCore.QRect(0, 0, MARKERPENWIDTH,
-                             MARKERPENWIDTH))
-        rect = poly.boundingRect()
-        r = rect.width()
-        pwr = pw.boundingRect()
-        pw_mapped = pwr.width()
-
         for airfoil in self.parent.airfoils:
             if hasattr(airfoil, 'markers'):
-                markers = airfoil.markers.childItems()
-                x, y = airfoil.raw_coordinates
-                for i, marker in enumerate(markers):
-                    # in case of circle, args is a QRectF
-                    marker.args = [QtCore.QRectF(x[i]-r, y[i]-r, 2.*r, 2.*r)]
-                    marker.penwidth = pw_mapped
+                airfoil.markers.updateMargin()
             if hasattr(airfoil, 'markersSpline'):
-                markers = airfoil.markersSpline.childItems()
-                x, y = airfoil.spline_data[0]
-                for i, marker in enumerate(markers):
-                    # in case of circle, args is a QRectF
-                    marker.args = [QtCore.QRectF(x[i]-r, y[i]-r, 2.*r, 2.*r)]
-                    marker.penwidth = pw_mapped
+                airfoil.markersSpline.updateMargin()
 
     def getSceneFromView(self):
         """Cache view to be able to keep it during resize"""
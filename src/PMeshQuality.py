@@ -0,0 +1,485 @@
+"""
+Quality of the cells of a quadrilateral mesh.
+
+All metrics are computed at once for all cells from the vertex and
+connectivity arrays (see PConnect). Each metric is a per-cell array,
+which can be used to colour the mesh.
+
+For the check before exporting a mesh, meshQuality goes through the
+blocks of a PConnect.MeshStream one at a time and only keeps a summary
+of the metrics: their range, histograms and the numbers of cells which
+violate the quality limits.
+
+Metrics:
+   - area
+     Signed cell area, positive for cells oriented like the mesh
+   - scaled_jacobian
+     Smallest corner Jacobian divided by the lengths of the two
+     edges at the corner (1 for rectangles, <= 0 for folded cells)
+   - aspect_ratio
+     Longest edge divided by shortest edge
+   - skewness
+     Equiangle skewness, max((angle_max - 90) / 90, (90 - angle_min) / 90)
+   - wall_orthogonality
+     Deviation from 90 degree of the corner angles at a wall edge
+     (NaN for cells without wall edge)
+   - growth
+     Largest area ratio to a neighbour cell (>= 1)
+"""
+
+import numpy as np
+import scipy.sparse
+
+import PLogger as logger
+
+
+# bin edges of the histograms written by logQuality
+BINS = {'scaled_jacobian': [-1.0, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        'aspect_ratio': [1.0, 2.0, 5.0, 10.0, 50.0, 100.0, 1000.0, np.inf],
+        'skewness': [0.0, 0.2, 0.4, 0.6, 0.8, 1.0],
+        'wall_orthogonality': [0.0, 5.0, 10.0, 20.0, 45.0, 90.0],
+        'growth': [1.0, 1.1, 1.2, 1.5, 2.0, 5.0, np.inf]}
+
+# cells per chunk in cellQuality
+CHUNKSIZE = 8192
+
+# limits for checkQuality, (metric, 'min' or 'max', value)
+LIMITS = [('scaled_jacobian', 'min', 0.0),
+          ('skewness', 'max', 0.95),
+          ('growth', 'max', 10.0)]
+
+
+def cellQuality(vertices, connectivity, wall=None, orientation=None,
+                shape=None):
+    """Quality metrics of all cells of a quadrilateral mesh
+
+    The metrics except the growth rate are computed for CHUNKSIZE cells
+    at a time, so that the temporary arrays stay in the CPU cache.
+
+    Args:
+        vertices (numpy array): Vertex coordinates with shape (n, 2)
+        connectivity (numpy array): Quad cells with shape (ncells, 4)
+        wall (numpy array, optional): Vertex numbers of the wall, e.g.
+            the 'airfoil' marker from PConnect.Connect.getMarkers
+        orientation (float, optional): 1 or -1 for the orientation of
+            valid cells, default is the orientation of most cells
+        shape (tuple, optional): (U, V) if the cells are the grid of a
+            block (see PConnect.Connect.getConnectivity), the growth
+            rate is then taken from the grid without searching edges
+
+    Returns:
+        dict: One float array with shape (ncells, ) per metric
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    cells = np.asarray(connectivity)
+    X = np.ascontiguousarray(vertices[:, 0])
+    Y = np.ascontiguousarray(vertices[:, 1])
+
+    if orientation is None:
+        area = 0.5 * ((X[cells[:, 2]] - X[cells[:, 0]]) *
+                      (Y[cells[:, 3]] - Y[cells[:, 1]]) -
+                      (Y[cells[:, 2]] - Y[cells[:, 0]]) *
+                      (X[cells[:, 3]] - X[cells[:, 1]]))
+        orientation = 1.0 if np.sum(area) >= 0.0 else -1.0
+
+    on_wall = None
+    if wall is not None and len(wall) > 0 and len(cells) > 0:
+        on_wall = np.zeros(max(np.max(cells), np.max(wall)) + 1, dtype=bool)
+        on_wall[wall] = True
+
+    quality = dict((metric, np.empty(len(cells))) for metric in
+                   ['area', 'scaled_jacobian', 'aspect_ratio', 'skewness',
+                    'wall_orthogonality'])
+    for start in range(0, len(cells), CHUNKSIZE):
+        chunk = slice(start, start + CHUNKSIZE)
+        metrics = cornerQuality(X, Y, cells[chunk], orientation, on_wall)
+        for metric, values in metrics.items():
+            quality[metric][chunk] = values
+
+    if shape is None:
+        quality['growth'] = growthRate(cells, quality['area'])
+    else:
+        quality['growth'] = gridGrowthRate(quality['area'], shape)
+
+    return quality
+
+
+def cornerQuality(X, Y, cells, orientation, on_wall=None):
+    """Quality metrics which follow from the corners of each cell
+
+    Args:
+        X (numpy array): x-coordinates of the vertices
+        Y (numpy array): y-coordinates of the vertices
+        cells (numpy array): Quad cells with shape (ncells, 4)
+        orientation (float): 1 or -1 for the orientation of valid cells
+        on_wall (numpy array, optional): True for the wall vertices
+
+    Returns:
+        dict: The metrics of cellQuality except the growth rate
+    """
+    # corner coordinates with shape (4, ncells), i.e. one row per corner,
+    # so that operations over the corners work on contiguous rows
+    X = X[cells.T]
+    Y = Y[cells.T]
+
+    # edges from corner k to corner k+1 and their lengths
+    nxt = [1, 2, 3, 0]
+    prv = [3, 0, 1, 2]
+    ex = X[nxt] - X
+    ey = Y[nxt] - Y
+    lengths = np.sqrt(ex * ex + ey * ey)
+
+    # corner k is spanned by edge k and the reversed edge k-1
+    cross = ey * ex[prv] - ex * ey[prv]
+    dot = -(ex * ex[prv] + ey * ey[prv])
+
+    # area from the diagonals
+    area = 0.5 * ((X[2] - X[0]) * (Y[3] - Y[1]) -
+                  (Y[2] - Y[0]) * (X[3] - X[1]))
+    area *= orientation
+    cross *= orientation
+
+    quality = dict()
+    quality['area'] = area
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corner_lengths = lengths * lengths[prv]
+        sine = cross / corner_lengths
+        cosine = dot / corner_lengths
+        quality['scaled_jacobian'] = np.minimum.reduce(sine)
+        quality['aspect_ratio'] = np.maximum.reduce(lengths) / \
+            np.minimum.reduce(lengths)
+
+    # largest and smallest corner angle from a pseudo angle, which grows
+    # monotonically with the angle from 0 to 4 (0 to 360 degree), so that
+    # only two angles per cell need an arccos
+    pseudo = np.where(sine >= 0.0, 1.0 - cosine, 3.0 + cosine)
+    largest = cornerAngle(np.maximum.reduce(pseudo))
+    smallest = cornerAngle(np.minimum.reduce(pseudo))
+    quality['skewness'] = np.minimum(np.maximum((largest - 90.0) / 90.0,
+                                                (90.0 - smallest) / 90.0),
+                                     1.0)
+
+    quality['wall_orthogonality'] = wallOrthogonality(cells, cross, dot,
+                                                      on_wall)
+
+    return quality
+
+
+def meshQuality(mesh, bins=BINS, limits=LIMITS):
+    """Summary of the quality metrics of a connected mesh
+
+    The metrics are computed block by block, so the mesh is never held
+    in memory at once. The growth rate of the cells at the sides of a
+    block depends on cells of other blocks, so these cells are kept
+    until all blocks are done.
+
+    Args:
+        mesh (PConnect.MeshStream): Mesh, the airfoil boundary is the wall
+        bins (dict, optional): Bin edges of the histogram of each metric
+        limits (list, optional): (metric, 'min' or 'max', value)
+
+    Returns:
+        dict: Summary as returned by summarizeQuality
+    """
+    summary = None
+    orientation = None
+    sides = list()
+    for block, numbers, new in mesh.iterBlocks(mesh.blocks,
+                                               mesh.interfaces):
+        vertices = mesh.getVertices(block)
+        cells = mesh.getConnectivity(block)
+        wall = [mesh.getNodeNumbers(block, nodes)
+                for part, nodes in mesh.boundaries.get('airfoil', [])
+                if part is block]
+        wall = np.concatenate(wall) if wall else None
+
+        # all blocks have the orientation of the first block, which is
+        # the sign of the area enclosed by its sides
+        if orientation is None:
+            outline = vertices[mesh.getBlockEdges(block)]
+            orientation = 1.0 if np.sum(
+                outline[:, 0, 0] * outline[:, 1, 1] -
+                outline[:, 1, 0] * outline[:, 0, 1]) >= 0.0 else -1.0
+
+        U, V = block.getDivUV()
+        quality = cellQuality(vertices, cells, wall=wall,
+                              orientation=orientation, shape=(U, V))
+
+        side = np.zeros((U, V), dtype=bool)
+        side[[0, -1]] = True
+        side[:, [0, -1]] = True
+        side = side.ravel()
+
+        inner = dict((metric, values[~side])
+                     for metric, values in quality.items())
+        summary = mergeQuality(summary, summarizeQuality(inner, bins,
+                                                         limits))
+
+        side_quality = dict((metric, values[side])
+                            for metric, values in quality.items())
+        sides.append((numbers[cells[side]], side_quality))
+
+    if sides:
+        # growth rate to the neighbours in other blocks
+        cells = np.concatenate([side[0] for side in sides])
+        quality = dict((metric, np.concatenate([side[1][metric]
+                                                for side in sides]))
+                       for metric in sides[0][1])
+        quality['growth'] = np.maximum(quality['growth'],
+                                       growthRate(cells, quality['area']))
+        summary = mergeQuality(summary, summarizeQuality(quality, bins,
+                                                         limits))
+
+    return summary
+
+
+def cornerAngle(pseudo):
+    """Angle in degree from the pseudo angle used in cellQuality"""
+    convex = pseudo <= 2.0
+    angle = np.empty_like(pseudo)
+    angle[convex] = np.degrees(np.arccos(np.clip(1.0 - pseudo[convex],
+                                                 -1.0, 1.0)))
+    angle[~convex] = 360.0 - np.degrees(np.arccos(np.clip(
+        pseudo[~convex] - 3.0, -1.0, 1.0)))
+    return angle
+
+
+def wallOrthogonality(cells, cross, dot, on_wall=None):
+    """Deviation from 90 degree of the corner angles at wall edges
+
+    Args:
+        cells (numpy array): Quad cells with shape (ncells, 4)
+        cross (numpy array): Corner Jacobians, shape (4, ncells)
+        dot (numpy array): Dot products of the edges at the corners
+        on_wall (numpy array, optional): True for the wall vertices
+
+    Returns:
+        numpy array: Largest deviation per cell (NaN without wall edge)
+    """
+    deviation = np.empty(len(cells))
+    deviation.fill(np.nan)
+    if on_wall is None:
+        return deviation
+
+    on_wall = on_wall[cells]
+
+    # edge k (corners k and k+1) is a wall edge
+    nxt = [1, 2, 3, 0]
+    wall_edge = on_wall & on_wall[:, nxt]
+    has_wall = np.any(wall_edge, axis=1)
+
+    angles = np.degrees(np.arctan2(cross[:, has_wall], dot[:, has_wall]))
+    corner = np.abs(angles.T % 360.0 - 90.0)
+    at_edge = np.where(wall_edge[has_wall],
+                       np.maximum(corner, corner[:, nxt]), -1.0)
+    deviation[has_wall] = np.max(at_edge, axis=1)
+
+    return deviation
+
+
+def growthRate(cells, area):
+    """Largest area ratio of each cell to its neighbours
+
+    Each edge is entered into a sparse (vertex, vertex) matrix with the
+    number of its cell; duplicates are summed, so for an edge shared by
+    two cells the entry holds both cell numbers (and a count in the high
+    bits). This avoids sorting the edges.
+
+    Args:
+        cells (numpy array): Quad cells with shape (ncells, 4)
+        area (numpy array): Cell areas
+
+    Returns:
+        numpy array: Largest ratio (>= 1) per cell, 1 without neighbours
+    """
+    ncells = len(cells)
+    nvertices = np.max(cells) + 1
+
+    # edges k of all cells, then edges k+1 (as the corners in cellQuality)
+    first = np.array(cells.T, dtype=np.int64).ravel()
+    second = np.array(cells.T[[1, 2, 3, 0]], dtype=np.int64).ravel()
+    lower = np.minimum(first, second)
+    upper = np.maximum(first, second)
+    cell = np.tile(np.arange(ncells, dtype=np.int64), 4)
+
+    one = np.int64(1) << 32
+    edges = scipy.sparse.csr_matrix((cell + one, (lower, upper)),
+                                    shape=(nvertices, nvertices))
+    entry = np.asarray(edges[lower, upper]).ravel()
+    shared = (entry >> 32) == 2
+    neighbour = (entry & (one - 1)) - cell
+
+    area = np.abs(area)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = area[cell[shared]] / area[neighbour[shared]]
+
+    growth = np.ones(4 * ncells)
+    growth[shared] = np.maximum(ratio, 1.0 / ratio)
+
+    return np.maximum.reduce(growth.reshape(4, ncells))
+
+
+def gridGrowthRate(area, shape):
+    """Largest area ratio of each cell to its neighbours in a grid
+
+    Args:
+        area (numpy array): Cell areas ordered as in
+                            PConnect.Connect.getConnectivity
+        shape (tuple): (U, V) numbers of cells of the grid
+
+    Returns:
+        numpy array: Largest ratio (>= 1) per cell, 1 without neighbours
+    """
+    area = np.abs(area).reshape(shape)
+    growth = np.ones(shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for axis in (0, 1):
+            first = [slice(None)] * 2
+            second = [slice(None)] * 2
+            first[axis] = slice(None, -1)
+            second[axis] = slice(1, None)
+            ratio = area[tuple(second)] / area[tuple(first)]
+            ratio = np.maximum(ratio, 1.0 / ratio)
+            growth[tuple(first)] = np.maximum(growth[tuple(first)], ratio)
+            growth[tuple(second)] = np.maximum(growth[tuple(second)], ratio)
+    return growth.ravel()
+
+
+def summarizeQuality(quality, bins=BINS, limits=LIMITS):
+    """Summary of per-cell metrics
+
+    Args:
+        quality (dict): Metrics as returned by cellQuality
+        bins (dict, optional): Bin edges of the histogram of each metric
+        limits (list, optional): (metric, 'min' or 'max', value)
+
+    Returns:
+        dict: 'ncells', 'metrics' with min, max, sum, count (of the
+              finite values) and histogram for each metric in bins, and
+              'limits' as (metric, kind, value, number of violating
+              cells) tuples
+    """
+    summary = {'ncells': len(quality['area']),
+               'metrics': dict(),
+               'limits': list()}
+
+    for metric in bins:
+        values = quality[metric]
+        values = values[np.isfinite(values)]
+        summary['metrics'][metric] = {
+            'min': np.min(values) if len(values) else np.inf,
+            'max': np.max(values) if len(values) else -np.inf,
+            'sum': np.sum(values),
+            'count': len(values),
+            'histogram': histogram(values, bins[metric])}
+
+    for metric, kind, value in limits:
+        values = quality[metric]
+        if kind == 'min':
+            bad = np.count_nonzero(values <= value)
+        else:
+            bad = np.count_nonzero(values > value)
+        summary['limits'].append((metric, kind, value, bad))
+
+    return summary
+
+
+def histogram(values, edges):
+    """Numbers of values in bins, values outside are counted in the
+    first and the last bin
+
+    Like numpy.histogram, the bins include their lower edge and the last
+    bin also its upper edge. The bin of each value is searched among the
+    edges, which is faster than numpy.histogram with uneven bins as it
+    does not sort the values.
+
+    Args:
+        values (numpy array): Values
+        edges (list): Increasing bin edges
+
+    Returns:
+        numpy array: Number of values in each bin
+    """
+    nbins = len(edges) - 1
+    bins = np.searchsorted(edges, values, side='right') - 1
+    return np.bincount(np.clip(bins, 0, nbins - 1), minlength=nbins)
+
+
+def mergeQuality(summary, other):
+    """Summary of the cells of two summaries (see summarizeQuality)
+
+    Args:
+        summary (dict): Summary, None for no cells
+        other (dict): Summary with the same bins and limits
+
+    Returns:
+        dict: Summary of the cells of both
+    """
+    if summary is None:
+        return other
+
+    merged = {'ncells': summary['ncells'] + other['ncells'],
+              'metrics': dict(),
+              'limits': list()}
+
+    for metric, first in summary['metrics'].items():
+        second = other['metrics'][metric]
+        merged['metrics'][metric] = {
+            'min': min(first['min'], second['min']),
+            'max': max(first['max'], second['max']),
+            'sum': first['sum'] + second['sum'],
+            'count': first['count'] + second['count'],
+            'histogram': first['histogram'] + second['histogram']}
+
+    for first, second in zip(summary['limits'], other['limits']):
+        merged['limits'].append(first[:3] + (first[3] + second[3], ))
+
+    return merged
+
+
+def checkQuality(summary):
+    """Check the cells against the quality limits of a summary
+
+    Args:
+        summary (dict): Summary as returned by summarizeQuality or
+                        meshQuality
+
+    Returns:
+        list: Messages for the violated limits (empty if all cells pass)
+    """
+    messages = list()
+    for metric, kind, value, bad in summary['limits']:
+        if bad:
+            messages.append('%s cells with %s %s %s' %
+                            (bad, metric, '<=' if kind == 'min' else '>',
+                             value))
+    return messages
+
+
+def logQuality(summary, bins=BINS):
+    """Write the quality metrics as histograms to the log
+
+    Args:
+        summary (dict): Summary as returned by summarizeQuality or
+                        meshQuality
+        bins (dict, optional): Bin edges for each metric, the same as
+                               for the summary
+    """
+    logger.log.info('Mesh quality of %s cells' % (summary['ncells']))
+
+    for metric in sorted(bins):
+        values = summary['metrics'][metric]
+        if values['count'] == 0:
+            continue
+
+        logger.log.info('<b>%s</b>: min %.4g, mean %.4g, max %.4g' %
+                        (metric, values['min'],
+                         values['sum'] / values['count'], values['max']))
+
+        edges = bins[metric]
+        counts = values['histogram']
+        for count, lower, upper in zip(counts, edges[:-1], edges[1:]):
+            bar = '|' * int(round(40.0 * count / values['count']))
+            logger.log.info('&nbsp;&nbsp;%8.4g - %-8.4g %8d %s' %
+                            (lower, upper, count, bar))
@@ -45,6 +45,12 @@ ICONS_L = ICONS + '24x24/'
 # path can be absolute or relative (to position where starting PyAero)
 AIRFOILDATA = PYAEROPATH + '/data/Airfoils'
 
+# cache of parsed airfoil contours (see PContourReader)
+CONTOURCACHE = PYAEROPATH + '/data/Cache/contours.sqlite'
+
+# index of the airfoil library for queries (see PAirfoilIndex)
+AIRFOILINDEX = PYAEROPATH + '/data/Cache/airfoils.sqlite'
+
 # size of airfoil coordinate markers in pixels
 MARKERSIZE = 3
 MARKERPENWIDTH = 1
@@ -54,7 +60,8 @@ DEFAULT_CONTOUR = AIRFOILDATA + '/F1K/hn1033a.dat'
 
 # set the filter for files to be shown in dialogs
 DIALOGFILTER = 'Airfoil contour files (*.dat *.txt);;STL files (*.stl)'
-DIALOGFILTER_MESH = 'Mesh files FIRE(*.flma);;Mesh files SU2 (*.su2);;Mesh files GMSH (*.msh)'
+DIALOGFILTER_MESH = 'Mesh files FIRE(*.flma);;Mesh files SU2 (*.su2);;' + \
+                    'Mesh files GMSH (*.msh);;Mesh files NPZ (*.npz)'
 
 # set the filter for files to be shown in the airfoil browser
 FILEFILTER = ['*.dat', '*.txt', '*.msh']
@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+
+"""
+Source-vortex panel method
+http://nbviewer.ipython.org/github/barbagroup/AeroPython/blob/master/
+lessons/11_Lesson11_vortexSourcePanelMethod.ipynb
+
+Code under MIT license. (c)2014 Lorena A. Barba, Olivier Mesnard.
+
+This module only depends on numpy and scipy. It does not import Qt nor
+the PyAero logger, so it can be used on headless machines and in worker
+processes. The GUI adapter is PSvpMethod.
+"""
+
+import math
+import time
+import multiprocessing
+import numpy
+from scipy import linalg
+
+
+class PanelSet(object):
+    """Contains information related to all panels of a geometry.
+
+    Each quantity is stored as one contiguous float64 array with one entry
+    per panel (struct-of-arrays), so that all functions of this module
+    work on whole arrays instead of looping over panel objects.
+    """
+    def __init__(self, xa, ya, xb, yb):
+        """Creates the panels.
+
+        Arguments
+        ---------
+        xa, ya -- Cartesian coordinates of the first end-points (1D arrays).
+        xb, yb -- Cartesian coordinates of the second end-points (1D arrays).
+        """
+        self.xa = numpy.ascontiguousarray(xa, dtype=numpy.float64)
+        self.ya = numpy.ascontiguousarray(ya, dtype=numpy.float64)
+        self.xb = numpy.ascontiguousarray(xb, dtype=numpy.float64)
+        self.yb = numpy.ascontiguousarray(yb, dtype=numpy.float64)
+
+        # control-points (center-points)
+        self.xc = (self.xa+self.xb)/2
+        self.yc = (self.ya+self.yb)/2
+        # length of the panels
+        self.length = numpy.sqrt((self.xb-self.xa)**2+(self.yb-self.ya)**2)
+
+        # orientation of the panels (angle between x-axis and panel's normal)
+        cosine = numpy.clip((self.yb-self.ya)/self.length, -1.0, 1.0)
+        self.beta = numpy.where(self.xb-self.xa <= 0.,
+                                numpy.arccos(cosine),
+                                math.pi + numpy.arccos(-cosine))
+
+        N = len(self.xa)
+        self.sigma = numpy.zeros(N, dtype=numpy.float64)  # source strength
+        self.vt = numpy.zeros(N, dtype=numpy.float64)     # tangential velocity
+        self.cp = numpy.zeros(N, dtype=numpy.float64)     # pressure coefficient
+
+    def __len__(self):
+        return len(self.xa)
+
+    @property
+    def loc(self):
+        """Location of the panels ('upper' or 'lower')."""
+        return numpy.where(self.beta <= math.pi, 'upper', 'lower')
+
+
+class SvpResult(object):
+    """Results of a source-vortex panel method run."""
+    def __init__(self, panels, freestream, gamma, cl, timings):
+        """Collects the results.
+
+        The arrays sigma, vt and cp are the arrays of the panel set,
+        they are not copied.
+
+        Arguments
+        ---------
+        panels -- panel set (carrying sigma, vt and cp).
+        freestream -- farfield conditions.
+        gamma -- circulation density.
+        cl -- lift coefficient.
+        timings -- dictionary of wall-clock times (seconds) per step.
+        """
+        self.panels = panels
+        self.freestream = freestream
+        self.gamma = gamma
+        self.cl = cl
+        self.timings = timings
+
+        self.sigma = panels.sigma
+        self.vt = panels.vt
+        self.cp = panels.cp
+
+
+class Freestream(object):
+    """Freestream conditions."""
+    def __init__(self, u_inf=1.0, alpha=0.0):
+        """Sets the freestream conditions.
+
+        Arguments
+        ---------
+        u_inf -- Farfield speed (default 1.0).
+        alpha -- Angle of attack in degrees (default 0.0).
+        """
+        self.u_inf = u_inf
+        self.alpha = alpha*math.pi/180          # degrees --> radians
+
+#
+# functions
+#
+
+
+def define_panels(x, y, N=40):
+    """Discretizes the geometry into panels using 'cosine' method.
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the geometry (1D arrays).
+    N - number of panels (default 40).
+
+    Returns
+    -------
+    panels -- PanelSet with N panels.
+    """
+    R = (x.max()-x.min())/2  # radius of the circle
+    x_center = (x.max()+x.min())/2  # x-coord of the center
+    x_circle = x_center + R*numpy.cos(numpy.linspace(0, 2*math.pi, N+1))  # x-coord of the circle points
+
+    x_ends = numpy.copy(x_circle)  # projection of the x-coord on the surface
+
+    x, y = numpy.append(x, x[0]), numpy.append(y, y[0])    # extend arrays using numpy.append
+
+    # finds the contour segment of each end-point (walking along the contour)
+    segment = numpy.empty(N, dtype=int)
+    I = 0
+    for i in xrange(N):
+        while I < len(x)-1:
+            if (x[I] <= x_ends[i] <= x[I+1]) or (x[I+1] <= x_ends[i] <= x[I]):
+                break
+            else:
+                I += 1
+        segment[i] = I
+
+    # computes the y-coordinate of end-points
+    y_ends = numpy.empty_like(x_ends)
+    x0, x1 = x[segment], x[segment+1]
+    y0, y1 = y[segment], y[segment+1]
+    a = (y1-y0)/(x1-x0)
+    b = y1 - a*x1
+    y_ends[:N] = a*x_ends[:N] + b
+    y_ends[N] = y_ends[0]
+
+    return PanelSet(x_ends[:-1], y_ends[:-1], x_ends[1:], y_ends[1:])
+
+
+def panel_kernels(x, y, panels):
+    """Evaluates the closed-form panel integrals at a set of points.
+
+    The integral over a straight panel of constant strength is computed
+    in closed form. In panel coordinates (xi along the panel, eta normal
+    to it) the kernel splits into a logarithmic part (tangential
+    component) and an arctangent part (normal component).
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the points (1D arrays of size M).
+    panels -- panels which contribution is evaluated (N panels).
+
+    Returns
+    -------
+    log_term, theta -- MxN arrays of the tangential and normal kernels.
+    """
+    sinb, cosb = numpy.sin(panels.beta), numpy.cos(panels.beta)
+    length = panels.length
+
+    x = numpy.asarray(x, dtype=float).reshape(-1, 1)
+    y = numpy.asarray(y, dtype=float).reshape(-1, 1)
+
+    # point in panel coordinates (xi along the panel, eta normal to it)
+    dx, dy = x - panels.xa, y - panels.ya
+    xi = -dx*sinb + dy*cosb
+    eta = dx*cosb + dy*sinb
+
+    r0 = xi**2 + eta**2                # squared distance to first end-point
+    r1 = (xi-length)**2 + eta**2       # squared distance to second end-point
+
+    # angle subtended by the panel; for points on the panel line the
+    # principal value (zero) is taken, as the quadrature did
+    theta = numpy.arctan2(eta*length, eta**2 + xi*(xi-length))
+    theta[numpy.abs(eta) <= 1.0e-12*length] = 0.0
+
+    return 0.5*numpy.log(r0/r1), theta
+
+
+def integral_matrix(x, y, panels, dxdz, dydz):
+    """Evaluates the contribution of all panels at a set of points.
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the points (1D arrays of size M).
+    panels -- panels which contribution is evaluated (N panels).
+    dxdz -- derivative of x in the z-direction (scalar or array of size M).
+    dydz -- derivative of y in the z-direction (scalar or array of size M).
+
+    Returns
+    -------
+    I -- MxN array, I[i, j] is the integral over panel j at point i.
+    """
+    sinb, cosb = numpy.sin(panels.beta), numpy.cos(panels.beta)
+
+    dxdz = numpy.asarray(dxdz, dtype=float).reshape(-1, 1)
+    dydz = numpy.asarray(dydz, dtype=float).reshape(-1, 1)
+
+    # direction (dxdz, dydz) in panel coordinates
+    gt = -dxdz*sinb + dydz*cosb
+    gn = dxdz*cosb + dydz*sinb
+
+    log_term, theta = panel_kernels(x, y, panels)
+
+    return gt*log_term + gn*theta
+
+
+def source_matrix(panels):
+    """Builds the source matrix.
+
+    Arguments
+    ---------
+    panels -- panel set.
+
+    Returns
+    -------
+    A -- NxN matrix (N is the number of panels).
+    """
+    A = 0.5/math.pi*integral_matrix(panels.xc, panels.yc, panels,
+                                    numpy.cos(panels.beta),
+                                    numpy.sin(panels.beta))
+    numpy.fill_diagonal(A, 0.5)
+
+    return A
+
+
+def vortex_array(panels):
+    """Builds the vortex array.
+
+    Arguments
+    ---------
+    panels - panel set.
+
+    Returns
+    -------
+    a -- 1D array (Nx1, N is the number of panels).
+    """
+    B = 0.5/math.pi*integral_matrix(panels.xc, panels.yc, panels,
+                                    +numpy.sin(panels.beta),
+                                    -numpy.cos(panels.beta))
+    numpy.fill_diagonal(B, 0.0)
+
+    return -B.sum(axis=1)
+
+
+def kutta_array(panels):
+    """Builds the Kutta-condition array.
+
+    Arguments
+    ---------
+    panels -- panel set.
+
+    Returns
+    -------
+    a -- 1D array (Nx1, N is the number of panels).
+    """
+    N = len(panels)
+    a = numpy.zeros(N+1, dtype=float)
+
+    # only the control points of the first and the last panel are needed
+    ends = [0, N-1]
+    xc, yc, beta = panels.xc[ends], panels.yc[ends], panels.beta[ends]
+
+    At = 0.5/math.pi*integral_matrix(xc, yc, panels,
+                                     -numpy.sin(beta), +numpy.cos(beta))
+    An = 0.5/math.pi*integral_matrix(xc, yc, panels,
+                                     +numpy.cos(beta), +numpy.sin(beta))
+
+    a[0] = At[1, 0]
+    a[N-1] = At[0, N-1]
+
+    # same layout as the original quadrature loop over panels[1:N-1]
+    a[0:N-2] = At[0, 1:N-1] + At[1, 1:N-1]
+    a[N] = -numpy.sum(An[0, 1:N-1] + An[1, 1:N-1])
+
+    return a
+
+
+def build_matrix(panels):
+    """Builds the matrix of the linear system.
+
+    Arguments
+    ---------
+    panels -- panel set.
+
+    Returns
+    -------
+    A -- (N+1)x(N+1) matrix (N is the number of panels).
+    """
+    N = len(panels)
+    A = numpy.empty((N+1, N+1), dtype=float)
+
+    AS = source_matrix(panels)
+    av = vortex_array(panels)
+    ak = kutta_array(panels)
+
+    A[0:N,0:N], A[0:N,N], A[N,:] = AS[:,:], av[:], ak[:]
+
+    return A
+
+
+def build_rhs(panels, freestream):
+    """Builds the RHS of the linear system.
+
+    Arguments
+    ---------
+    panels -- panel set.
+    freestream -- farfield conditions.
+
+    Returns
+    -------
+    b -- 1D array ((N+1)x1, N is the number of panels).
+    """
+    N = len(panels)
+    b = numpy.empty(N+1,dtype=float)
+
+    b[:N] = -freestream.u_inf*numpy.cos(freestream.alpha - panels.beta)
+    b[N] = -freestream.u_inf*( math.sin(freestream.alpha-panels.beta[0])
+                              +math.sin(freestream.alpha-panels.beta[N-1]) )
+
+    return b
+
+
+def tangential_matrix(panels):
+    """Builds the matrix giving the tangential velocity at the panel centers.
+
+    Arguments
+    ---------
+    panels -- panel set.
+
+    Returns
+    -------
+    A -- Nx(N+1) matrix (N is the number of panels), to be multiplied with
+         the source strengths and the circulation density.
+    """
+    N = len(panels)
+    A = numpy.empty((N, N+1), dtype=float)
+
+    sinb, cosb = numpy.sin(panels.beta), numpy.cos(panels.beta)
+
+    A[:, :N] = 0.5/math.pi*integral_matrix(panels.xc, panels.yc, panels,
+                                           -sinb, +cosb)
+    numpy.fill_diagonal(A, 0.0)
+
+    An = 0.5/math.pi*integral_matrix(panels.xc, panels.yc, panels,
+                                     +cosb, +sinb)
+    numpy.fill_diagonal(An, 0.0)
+    A[:, N] = -An.sum(axis=1)
+
+    return A
+
+
+def get_tangential_velocity(panels, freestream, gamma):
+    """Computes the tangential velocity on the surface.
+
+    Arguments
+    ---------
+    panels -- panel set.
+    freestream -- farfield conditions.
+    gamma -- circulation density.
+    """
+    A = tangential_matrix(panels)
+
+    b = freestream.u_inf*numpy.sin(freestream.alpha - panels.beta)
+
+    var = numpy.append(panels.sigma, gamma)
+
+    panels.vt = numpy.dot(A, var) + b
+
+
+def induced_velocity(x, y, panels, gamma=0.0):
+    """Computes the velocity induced by the panels at a set of points.
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the points (1D arrays).
+    panels -- panel set (carrying the source strengths sigma).
+    gamma -- circulation density (default 0.0).
+
+    Returns
+    -------
+    u, v -- velocity components (1D arrays), without freestream.
+    """
+    sinb, cosb = numpy.sin(panels.beta), numpy.cos(panels.beta)
+
+    log_term, theta = panel_kernels(x, y, panels)
+
+    # integrals in x-direction (dxdz=1, dydz=0) and y-direction (0, 1)
+    Ix = -sinb*log_term + cosb*theta
+    Iy = cosb*log_term + sinb*theta
+
+    u = 0.5/math.pi*(numpy.dot(Ix, panels.sigma) + gamma*Iy.sum(axis=1))
+    v = 0.5/math.pi*(numpy.dot(Iy, panels.sigma) - gamma*Ix.sum(axis=1))
+
+    return u, v
+
+
+def _induced_velocity_chunk(args):
+    """Unpacks the arguments of induced_velocity (for multiprocessing)."""
+    return induced_velocity(*args)
+
+
+def get_velocity_field(panels, freestream, X, Y, gamma=0.0,
+                       chunksize=None, processes=None):
+    """Returns the velocity field.
+
+    The grid points are processed in blocks, so that the temporary
+    (points x panels) arrays stay bounded in size. The blocks are
+    optionally distributed over a pool of worker processes.
+
+    Arguments
+    ---------
+    panels -- panel set.
+    freestream -- farfield conditions.
+    X, Y -- mesh grid.
+    gamma -- circulation density (default 0.0, i.e. no vortex contribution).
+    chunksize -- number of grid points per block (default: about 2**18
+                 kernel evaluations per block).
+    processes -- number of worker processes (default None, i.e. serial).
+
+    Returns
+    -------
+    u, v -- velocity components (same shape as X).
+    """
+    x, y = numpy.ravel(X), numpy.ravel(Y)
+
+    if chunksize is None:
+        chunksize = max(1, 2**18 // len(panels))
+
+    chunks = [(x[i:i+chunksize], y[i:i+chunksize], panels, gamma)
+              for i in xrange(0, len(x), chunksize)]
+
+    if processes:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_induced_velocity_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_induced_velocity_chunk(chunk) for chunk in chunks]
+
+    u = freestream.u_inf*math.cos(freestream.alpha) + \
+        numpy.concatenate([result[0] for result in results])
+    v = freestream.u_inf*math.sin(freestream.alpha) + \
+        numpy.concatenate([result[1] for result in results])
+
+    return u.reshape(numpy.shape(X)), v.reshape(numpy.shape(X))
+
+
+def get_pressure_field(u, v, freestream):
+    cp = 1.0 - (u**2+v**2)/freestream.u_inf**2
+    return cp
+
+
+def get_meshgrid(panels, Nx, Ny, val_x, val_y):
+    # defines a mesh grid
+    # Nx, Ny = 20, 20
+    # val_x, val_y = 1.0, 2.0
+    x_min, x_max = panels.xa.min(), panels.xa.max()
+    y_min, y_max = panels.ya.min(), panels.ya.max()
+    x_start, x_end = x_min-val_x*(x_max-x_min), x_max+val_x*(x_max-x_min)
+    y_start, y_end = y_min-val_y*(y_max-y_min), y_max+val_y*(y_max-y_min)
+
+    X, Y = numpy.meshgrid(numpy.linspace(x_start, x_end, Nx), numpy.linspace(y_start, y_end, Ny))
+
+    return X, Y
+
+
+def get_pressure_coefficient(panels, freestream):
+    """Computes the surface pressure coefficients.
+
+    Arguments
+    ---------
+    panels -- panel set.
+    freestream -- farfield conditions.
+    """
+    panels.cp = 1.0 - (panels.vt/freestream.u_inf)**2
+
+
+def get_lift_coefficient(panels, freestream, gamma):
+    """Computes the lift coefficient from the circulation.
+
+    Arguments
+    ---------
+    panels -- panel set.
+    freestream -- farfield conditions.
+    gamma -- circulation density (scalar or array).
+
+    Returns
+    -------
+    cl -- lift coefficient (same shape as gamma).
+    """
+    chord = panels.xa.max() - panels.xa.min()
+    return gamma*numpy.sum(panels.length) / (0.5*freestream.u_inf*chord)
+
+
+def compute_polar(x, y, alphas, npanel=40, u_inf=1.0):
+    """Computes lift and surface pressure for a sweep of angles of attack.
+
+    Only the right-hand side of the linear system depends on the angle of
+    attack. The system matrix is therefore built and LU-factorized once
+    and all angles are solved together as a multi-column right-hand side.
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the geometry (1D arrays).
+    alphas -- angles of attack in degrees (1D array).
+    npanel -- number of panels (default 40).
+    u_inf -- farfield speed (default 1.0).
+
+    Returns
+    -------
+    cl -- 1D array of lift coefficients (one per angle of attack).
+    cp -- 2D array of surface pressure coefficients (angles x panels).
+    """
+    panels = define_panels(numpy.asarray(x, dtype=float),
+                           numpy.asarray(y, dtype=float), npanel)
+    N = len(panels)
+
+    alphas = numpy.radians(numpy.atleast_1d(numpy.asarray(alphas,
+                                                          dtype=float)))
+    beta = panels.beta[:, numpy.newaxis]
+
+    # geometry dependent part, factorized once for all angles of attack
+    lu_piv = linalg.lu_factor(build_matrix(panels))
+    At = tangential_matrix(panels)
+
+    # freestream right-hand sides, one column per angle of attack
+    b = numpy.empty((N+1, len(alphas)), dtype=float)
+    b[:N] = -u_inf*numpy.cos(alphas - beta)
+    b[N] = -u_inf*(numpy.sin(alphas-beta[0]) + numpy.sin(alphas-beta[N-1]))
+
+    variables = linalg.lu_solve(lu_piv, b)
+
+    vt = numpy.dot(At, variables) + u_inf*numpy.sin(alphas - beta)
+    cp = 1.0 - (vt/u_inf)**2
+
+    cl = get_lift_coefficient(panels, Freestream(u_inf), variables[N])
+
+    return cl, cp.T
+
+
+def solve(x, y, u_inf=1.0, alpha=0.0, npanel=40):
+    """Runs the source-vortex panel method for one angle of attack.
+
+    Arguments
+    ---------
+    x, y -- Cartesian coordinates of the geometry (1D arrays).
+    u_inf -- farfield speed (default 1.0).
+    alpha -- angle of attack in degrees (default 0.0).
+    npanel -- number of panels (default 40).
+
+    Returns
+    -------
+    result -- SvpResult with sigma, gamma, vt, cp, cl and timings.
+    """
+    timings = dict()
+
+    start = time.time()
+    # discretizes of the geometry into panels
+    panels = define_panels(numpy.asarray(x, dtype=float),
+                           numpy.asarray(y, dtype=float), npanel)
+    timings['panels'] = time.time() - start
+
+    # defines and creates the object freestream
+    freestream = Freestream(u_inf, alpha)
+
+    start = time.time()
+    # calculates the singularity matrix and the freestream RHS
+    A = build_matrix(panels)
+    b = build_rhs(panels, freestream)
+    timings['matrix'] = time.time() - start
+
+    start = time.time()
+    # solves the linear system
+    variables = numpy.linalg.solve(A, b)
+    timings['solve'] = time.time() - start
+
+    panels.sigma = variables[:-1]
+    gamma = variables[-1]
+
+    start = time.time()
+    # computes the tangential velocity at each panel center.
+    get_tangential_velocity(panels, freestream, gamma)
+
+    # computes surface pressure coefficient
+    get_pressure_coefficient(panels, freestream)
+    timings['velocity'] = time.time() - start
+
+    # calculates of the lift
+    cl = get_lift_coefficient(panels, freestream, gamma)
+
+    return SvpResult(panels, freestream, gamma, cl, timings)
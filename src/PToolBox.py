@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import functools
 
 from PyQt4 import QtGui, QtCore
 
@@ -8,13 +9,14 @@ import PyAero
 import PFileSystem
 import PIconProvider
 import PSvpMethod
-import PGraphicsItemsCollection as gc
-import PGraphicsItem
+import PGraphicsMesh
 import PSplineRefine
 import PTrailingEdge
 import PLogger as logger
 import PMeshing
 import PConnect
+import PMeshQuality
+import PWorker
 from PSettings import ICONS_L, DIALOGFILTER, DIALOGFILTER_MESH, OUTPUTDATA
 
 
@@ -76,7 +78,12 @@ class Toolbox(object):
         filesystem.tree.clicked.connect(filesystem.onFileSelected)
         filesystem.tree.doubleClicked.connect(filesystem.onFileLoad)
 
+        query = QtGui.QHBoxLayout()
+        query.addWidget(filesystem.query)
+        query.addWidget(filesystem.similar)
+        layout.addLayout(query)
         layout.addWidget(filesystem.tree, stretch=12)
+        layout.addWidget(filesystem.results, stretch=12)
         # layout.setAlignment(QtCore.Qt.AlignTop)
 
         self.header = QtGui.QLabel('Loaded airfoil(s)')
@@ -361,21 +368,34 @@ class Toolbox(object):
         self.check_FIRE = QtGui.QCheckBox('AVL FIRE')
         self.check_SU2 = QtGui.QCheckBox('SU2')
         self.check_GMSH = QtGui.QCheckBox('GMSH')
+        self.check_NPZ = QtGui.QCheckBox('NPZ')
+        self.check_quality = QtGui.QCheckBox('Check mesh quality')
         btn_group.addButton(self.check_FIRE)
         btn_group.addButton(self.check_SU2)
         self.check_FIRE.setChecked(True)
         self.check_SU2.setChecked(False)
         self.check_GMSH.setChecked(False)
+        self.check_NPZ.setChecked(False)
+        self.check_quality.setChecked(True)
+
+        # GMSH file format version and encoding
+        self.gmsh_format = QtGui.QComboBox()
+        self.gmsh_format.addItems(['2.2 ASCII', '2.2 binary',
+                                   '4.1 ASCII', '4.1 binary'])
         rdl.addStretch(5)
         rdl.addWidget(self.check_FIRE)
         rdl.addStretch(1)
         rdl.addWidget(self.check_SU2)
         rdl.addStretch(1)
         rdl.addWidget(self.check_GMSH)
+        rdl.addWidget(self.gmsh_format)
+        rdl.addStretch(1)
+        rdl.addWidget(self.check_NPZ)
         rdl.addStretch(5)
 
         vbl1 = QtGui.QVBoxLayout()
         vbl1.addLayout(rdl)
+        vbl1.addWidget(self.check_quality)
         vbl1.addLayout(hbox)
         vbl1.addLayout(hbl)
 
@@ -712,67 +732,86 @@ class Toolbox(object):
             else:
                 return
 
-        progdialog = QtGui.QProgressDialog(
-            "", "Cancel", 0, 4, self.parent)
-        progdialog.setWindowTitle('Generating the CFD mesh')
-        progdialog.setWindowModality(QtCore.Qt.WindowModal)
-        progdialog.show()
-
-        self.tunnel = PMeshing.Windtunnel()
+        # the widgets are read here, the mesh is made in a worker thread
+        parameters = {
+            'airfoil': {'divisions': self.points_n.value(),
+                        'ratio': self.ratio.value(),
+                        'thickness': self.normal_thickness.value()/100.0},
+            'te': {'te_divisions': self.te_div.value(),
+                   'length': self.length_te.value()/100.0,
+                   'divisions': self.points_te.value(),
+                   'ratio': self.ratio_te.value()},
+            'tunnel': {'tunnel_height': self.tunnel_height.value(),
+                       'divisions_height': self.divisions_height.value(),
+                       'ratio_height': self.ratio_height.value(),
+                       'dist': str(self.dist.currentText())},
+            'wake': {'tunnel_wake': self.tunnel_wake.value(),
+                     'divisions': self.divisions_wake.value(),
+                     'ratio': self.ratio_wake.value(),
+                     'spread': self.spread.value()/100.0}}
+
+        task = functools.partial(self.generateMesh, contour, parameters)
+        self.runWorker(task, 'Generating the CFD mesh',
+                       functools.partial(self.meshFinished, airfoil))
+
+    @staticmethod
+    def generateMesh(contour, parameters, progress):
+        """Make the wind tunnel mesh (task of a PWorker.Worker)
 
-        progdialog.setValue(0)
-        progdialog.setLabelText('making part 1/4')
+        Args:
+            contour (tuple): x and y coordinates of the airfoil contour
+            parameters (dict): Keyword arguments of the Windtunnel
+                               methods for 'airfoil', 'te', 'tunnel'
+                               and 'wake'
+            progress (function): Progress callback of the worker
+
+        Returns:
+            PMeshing.Windtunnel: The mesh blocks, the connected mesh and
+                                 its cell quality
+        """
+        tunnel = PMeshing.Windtunnel()
+
+        steps = [(tunnel.AirfoilMesh, 'block_airfoil', 'airfoil'),
+                 (tunnel.TrailingEdgeMesh, 'block_TE', 'te'),
+                 (tunnel.TunnelMesh, 'block_tunnel', 'tunnel'),
+                 (tunnel.TunnelMeshWake, 'block_tunnel_wake', 'wake')]
+        nsteps = len(steps) + 1
+
+        def stepProgress(step):
+            # progress of a step is part of the overall progress
+            return lambda text, fraction: \
+                progress('making part %s/%s: %s' % (step + 1, nsteps, text),
+                         (step + fraction) / nsteps)
+
+        for step, (method, name, key) in enumerate(steps):
+            tunnel.progress = stepProgress(step)
+            if key == 'airfoil':
+                method(name=name, contour=contour, **parameters[key])
+            else:
+                method(name=name, **parameters[key])
 
-        self.tunnel.AirfoilMesh(name='block_airfoil',
-                                contour=contour,
-                                divisions=self.points_n.value(),
-                                ratio=self.ratio.value(),
-                                thickness=self.normal_thickness.value()/100.0)
-        progdialog.setValue(1)
+        tunnel.progress = stepProgress(len(steps))
+        tunnel.fillInteriors()
+        tunnel.progress = None
 
-        if progdialog.wasCanceled():
-            return
-        progdialog.setLabelText('making part 2/4')
+        # connect mesh blocks (block by block while exporting)
+        tunnel.mesh = PConnect.MeshStream(tunnel.blocks,
+                                          tunnel.interfaces,
+                                          tunnel.boundaries)
 
-        self.tunnel.TrailingEdgeMesh(name='block_TE',
-                                     te_divisions=self.te_div.value(),
-                                     length=self.length_te.value()/100.0,
-                                     divisions=self.points_te.value(),
-                                     ratio=self.ratio_te.value())
-        progdialog.setValue(2)
+        # quality summary for the log and the export check
+        progress('checking the mesh quality', 1.0)
+        tunnel.quality = PMeshQuality.meshQuality(tunnel.mesh)
 
-        if progdialog.wasCanceled():
-            return
-        progdialog.setLabelText('making part 3/4')
+        return tunnel
 
-        self.tunnel.TunnelMesh(name='block_tunnel',
-                               tunnel_height=self.tunnel_height.value(),
-                               divisions_height=self.divisions_height.value(),
-                               ratio_height=self.ratio_height.value(),
-                               dist=self.dist.currentText())
-        progdialog.setValue(3)
+    def meshFinished(self, airfoil, tunnel):
 
-        if progdialog.wasCanceled():
-            return
-        progdialog.setLabelText('making part 4/4')
+        self.tunnel = tunnel
 
-        self.tunnel.TunnelMeshWake(name='block_tunnel_wake',
-                                   tunnel_wake=self.tunnel_wake.value(),
-                                   divisions=self.divisions_wake.value(),
-                                   ratio=self.ratio_wake.value(),
-                                   spread=self.spread.value()/100.0)
-        progdialog.setValue(4)
-
-        if progdialog.wasCanceled():
-            return
-
-        # connect mesh blocks
-        connect = PConnect.Connect()
-        self.tunnel.mesh = connect.connectAllBlocks(self.tunnel.blocks)
-        vertices, connectivity = self.tunnel.mesh
-
-        logger.log.info('Mesh has %s vertices' % (len(vertices)))
-        logger.log.info('Mesh has %s cells' % (len(connectivity)))
+        logger.log.info('Mesh has %s vertices' % (self.tunnel.mesh.nvertices))
+        logger.log.info('Mesh has %s cells' % (self.tunnel.mesh.ncells))
+        PMeshQuality.logQuality(self.tunnel.quality)
 
         self.drawMesh(airfoil)
 
@@ -781,6 +820,52 @@ class Toolbox(object):
         nameroot, extension = os.path.splitext(str(airfoil.name))
         self.lineedit_mesh.setText(nameroot + '_mesh')
 
+    def runWorker(self, task, title, finished):
+        """Run a task in a worker thread with a progress dialog
+
+        The dialog's cancel button stops the task at its next progress
+        report (see PWorker).
+
+        Args:
+            task (function): Task taking a progress callback
+            title (str): Title of the progress dialog
+            finished (function): Called with the result of the task
+        """
+        if hasattr(self, 'worker') and self.worker.isRunning():
+            logger.log.info('Please wait, a mesh task is still running')
+            return
+
+        progdialog = QtGui.QProgressDialog('', 'Cancel', 0, 100, self.parent)
+        progdialog.setWindowTitle(title)
+        progdialog.setWindowModality(QtCore.Qt.WindowModal)
+        progdialog.setMinimumDuration(0)
+        progdialog.setValue(0)
+
+        def setProgress(text, percent):
+            progdialog.setLabelText(text)
+            progdialog.setValue(percent)
+
+        def canceled():
+            progdialog.reset()
+            logger.log.info('%s canceled' % (title))
+
+        def failed(message):
+            progdialog.reset()
+            logger.log.error('%s failed: %s' % (title, message))
+
+        def done(result):
+            progdialog.reset()
+            finished(result)
+
+        # keep a reference, the thread must not be garbage collected
+        self.worker = PWorker.Worker(task)
+        self.worker.progress.connect(setProgress)
+        self.worker.canceled.connect(canceled)
+        self.worker.failed.connect(failed)
+        self.worker.done.connect(done)
+        progdialog.canceled.connect(self.worker.cancel)
+        self.worker.start()
+
     def drawMesh(self, airfoil):
 
         self.toggleSplinePoints()
@@ -789,56 +874,92 @@ class Toolbox(object):
         if hasattr(airfoil, 'mesh'):
             self.parent.scene.removeItem(airfoil.mesh)
 
-        airfoil.mesh = QtGui.QGraphicsItemGroup(parent=airfoil.contour_item,
-                                                scene=self.parent.scene)
-
-        for block in self.tunnel.blocks:
-            for lines in [block.getULines(),
-                          block.getVLines()]:
-                for line in lines:
-
-                    # instantiate a graphics item
-                    contour = gc.GraphicsCollection()
-                    # make it polygon type and populate its points
-                    points = [QtCore.QPointF(x, y) for x, y in line]
-                    contour.Polyline(QtGui.QPolygonF(points), '')
-                    # set its properties
-                    contour.pen.setColor(QtGui.QColor(0, 0, 0, 255))
-                    contour.pen.setWidth(0.8)
-                    contour.pen.setCosmetic(True)
-                    contour.brush.setStyle(QtCore.Qt.NoBrush)
-
-                    # add contour as a GraphicsItem to the scene
-                    # these are the objects which are drawn in the GraphicsView
-                    meshline = PGraphicsItem.GraphicsItem(contour,
-                                                          self.parent.scene)
-
-                    airfoil.mesh.addToGroup(meshline)
+        # all grid lines of all blocks are one graphics item
+        airfoil.mesh = PGraphicsMesh.MeshItem(self.tunnel.blocks,
+                                              parent=airfoil.contour_item)
 
         airfoil.contour_group.addToGroup(airfoil.mesh)
 
     @QtCore.pyqtSlot()
     def exportMesh(self, from_browse_mesh=False):
 
+        if self.check_quality.isChecked() and not self.checkMesh():
+            return
+
         name = self.lineedit_mesh.text()
 
         nameroot, extension = os.path.splitext(str(name))
 
         if from_browse_mesh:
-            fullname = name
+            fullname = str(name)
         else:
             fullname = OUTPUTDATA + nameroot
 
-        mesh = self.tunnel.mesh
+        # the widgets are read here, the files are written in a worker
+        writers = list()
 
         if self.check_FIRE.isChecked():
-            PMeshing.BlockMesh.writeFLMA(mesh, name=fullname, depth=0.3)
+            writers.append(functools.partial(PMeshing.BlockMesh.writeFLMA,
+                                             name=fullname, depth=0.3))
 
         if self.check_SU2.isChecked():
-            PMeshing.BlockMesh.writeSU2(mesh, name=fullname)
+            writers.append(functools.partial(PMeshing.BlockMesh.writeSU2,
+                                             name=fullname))
 
         if self.check_GMSH.isChecked():
-            PMeshing.BlockMesh.writeGMSH(mesh, name=fullname)
+            version, encoding = str(self.gmsh_format.currentText()).split()
+            writers.append(functools.partial(PMeshing.BlockMesh.writeGMSH,
+                                             name=fullname, version=version,
+                                             binary=(encoding == 'binary')))
+
+        if self.check_NPZ.isChecked():
+            writers.append(functools.partial(PMeshing.BlockMesh.writeNPZ,
+                                             name=fullname,
+                                             blocks=self.tunnel.blocks))
+
+        task = functools.partial(self.writeMesh, self.tunnel.mesh, writers)
+        self.runWorker(task, 'Exporting the CFD mesh', lambda result: None)
+
+    def checkMesh(self):
+        """Check the mesh quality before exporting
+
+        Returns:
+            bool: True if the mesh passes the quality limits or the user
+                  chooses to export it anyway
+        """
+        messages = PMeshQuality.checkQuality(self.tunnel.quality)
+        if not messages:
+            return True
+
+        for message in messages:
+            logger.log.warning('Mesh quality: %s' % (message))
+
+        reply = QtGui.QMessageBox. \
+            question(self.parent, 'Mesh quality',
+                     'The mesh has bad cells:\n%s\n\nExport anyway?' %
+                     ('\n'.join(messages)),
+                     QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                     QtGui.QMessageBox.No)
+        return reply == QtGui.QMessageBox.Yes
+
+    @staticmethod
+    def writeMesh(mesh, writers, progress):
+        """Write a mesh in several formats (task of a PWorker.Worker)
+
+        Args:
+            mesh (PConnect.MeshStream): Mesh, connected while writing
+            writers (list): Writer functions taking the mesh
+            progress (function): Progress callback of the worker
+        """
+        try:
+            for number, writer in enumerate(writers):
+                name = writer.keywords['name']
+                mesh.progress = lambda text, fraction: \
+                    progress('%s: %s' % (os.path.basename(name), text),
+                             (number + fraction) / len(writers))
+                writer(mesh)
+        finally:
+            mesh.progress = None
 
     @QtCore.pyqtSlot()
     def analyzeAirfoil(self):
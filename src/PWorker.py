@@ -0,0 +1,80 @@
+"""
+Background worker for long running tasks, e.g. mesh generation and export.
+
+The task runs in a QThread, so the GUI stays responsive. It reports its
+progress through a callback, which is also where it gets canceled.
+
+Example:
+    def task(progress):
+        for i in range(100):
+            progress('step %s' % (i), i / 100.0)
+        return result
+
+    worker = PWorker.Worker(task)
+    worker.progress.connect(dialog.setProgress)
+    worker.done.connect(self.useResult)
+    dialog.canceled.connect(worker.cancel)
+    worker.start()
+"""
+
+from PyQt4 import QtCore
+
+import PLogger as logger
+
+
+class Canceled(Exception):
+    """Raised by the progress callback of a canceled task"""
+    pass
+
+
+class Worker(QtCore.QThread):
+    """Run a task in a thread
+
+    Signals:
+        progress (str, int): Text and percentage reported by the task
+        done (object): Result of the task
+        canceled: The task was canceled
+        failed (str): The task raised an exception (the message)
+
+    Args:
+        task (function): Function taking a progress callback
+                         progress(text, fraction) with fraction from 0 to 1
+        parent (QObject, optional): Parent
+    """
+    progress = QtCore.pyqtSignal(str, int)
+    done = QtCore.pyqtSignal(object)
+    canceled = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, task, parent=None):
+        super(Worker, self).__init__(parent)
+        self.task = task
+        self._cancel = False
+
+    def run(self):
+        try:
+            result = self.task(self.report)
+        except Canceled:
+            self.canceled.emit()
+            return
+        except Exception as error:
+            logger.log.exception('Task failed')
+            self.failed.emit(str(error))
+            return
+
+        self.done.emit(result)
+
+    @QtCore.pyqtSlot()
+    def cancel(self):
+        """Cancel the task at its next progress report"""
+        self._cancel = True
+
+    def report(self, text, fraction):
+        """Progress callback passed to the task
+
+        Raises:
+            Canceled: If cancel was called
+        """
+        if self._cancel:
+            raise Canceled()
+        self.progress.emit(text, int(round(100.0 * fraction)))